@@ -0,0 +1,54 @@
+# diane_backends.py
+import os
+from diane_startup import LazyModule, preload_modules
+
+genai = LazyModule('google.generativeai')
+texttospeech = LazyModule('google.cloud.texttospeech')
+speech = LazyModule('google.cloud.speech')
+pyaudio = LazyModule('pyaudio')
+
+class GoogleBackend:
+    name = "google"
+
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+
+    def preload(self):
+        preload_modules(genai, texttospeech, speech)
+
+    def connect(self):
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        return texttospeech.TextToSpeechAsyncClient(), speech.SpeechAsyncClient()
+
+    def generative_model(self, model_name, system_instruction):
+        return genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+
+    def model_from_cache(self, cache):
+        return genai.GenerativeModel.from_cached_content(cached_content=cache)
+
+    def create_cache(self, model_name, system_instruction, contents, ttl):
+        return genai.caching.CachedContent.create(model=f"models/{model_name}", system_instruction=system_instruction, contents=contents, ttl=ttl)
+
+    def audio_interface(self):
+        return pyaudio.PyAudio()
+
+    async def warm_tts(self, client):
+        await client.list_voices(language_code="en-US")
+
+    async def warm_stt(self, client):
+        channel = client.transport.grpc_channel
+        channel.get_state(try_to_connect=True)
+        await channel.channel_ready()
+
+    async def warm_llm(self, model):
+        await model.count_tokens_async("ping")
+
+def create_backend(settings=None):
+    settings = settings or {}
+    provider = settings.get('provider', 'google')
+    if provider == 'google':
+        return GoogleBackend(settings)
+    if provider == 'fake':
+        from diane_fakes import FakeBackend
+        return FakeBackend(settings.get('fake', {}))
+    raise ValueError(f"Unknown backend provider '{provider}'.")
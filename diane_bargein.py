@@ -0,0 +1,150 @@
+# diane_bargein.py
+import math
+import time
+import asyncio
+from threading import Lock
+from collections import deque
+from diane_vad import chunk_level_dbfs, SILENCE_DBFS
+from diane_startup import LazyModule
+
+pyaudio = LazyModule('pyaudio')
+
+DEFAULT_BARGE_IN_SETTINGS = {
+    'enabled': False,
+    'preroll_ms': 500,
+    'speech_start_ms': 200,
+    'arm_delay_ms': 250,
+    'min_speech_dbfs': -40.0,
+    'speech_margin_db': 10.0,
+    'echo_gain_db': -10.0,
+    'echo_adapt_rate': 0.02,
+    'echo_tail_ms': 250,
+    'initial_noise_dbfs': -60.0,
+    'noise_adapt_rate': 0.05,
+    'resume_listening': True,
+}
+
+class BargeInDetector:
+    def __init__(self, settings, rate, chunk_frames):
+        self.settings = dict(DEFAULT_BARGE_IN_SETTINGS, **(settings or {}))
+        self.chunk_ms = chunk_frames / rate * 1000
+        self.preroll = deque(maxlen=max(1, int(math.ceil(self.settings['preroll_ms'] / self.chunk_ms))))
+        self.start_chunks = max(1, int(math.ceil(self.settings['speech_start_ms'] / self.chunk_ms)))
+        self.arm_chunks = int(math.ceil(self.settings['arm_delay_ms'] / self.chunk_ms))
+        self.release_db_per_s = 60.0 / max(0.001, self.settings['echo_tail_ms'] / 1000)
+        self.echo_gain = self.settings['echo_gain_db']
+        self.noise_floor = self.settings['initial_noise_dbfs']
+        self.output_peak = (SILENCE_DBFS, time.perf_counter())
+        self.voiced_run = 0
+        self.counts = {'chunks': 0, 'voiced': 0, 'echo_gated': 0}
+
+    def note_output(self, level):
+        now = time.perf_counter()
+        if level >= self._reference(now):
+            self.output_peak = (level, now)
+
+    def _reference(self, now):
+        level, at = self.output_peak
+        return max(SILENCE_DBFS, level - (now - at) * self.release_db_per_s)
+
+    def process(self, data):
+        self.counts['chunks'] += 1
+        self.preroll.append(data)
+        level = chunk_level_dbfs(data)
+        reference = self._reference(time.perf_counter())
+        echo_level = reference + self.echo_gain
+        margin = self.settings['speech_margin_db']
+        voiced = level >= max(self.settings['min_speech_dbfs'], self.noise_floor + margin, echo_level + margin)
+        if voiced:
+            self.counts['voiced'] += 1
+            self.voiced_run += 1
+        else:
+            if level >= max(self.settings['min_speech_dbfs'], self.noise_floor + margin):
+                self.counts['echo_gated'] += 1
+            self.voiced_run = 0
+            if reference > SILENCE_DBFS:
+                self.echo_gain += self.settings['echo_adapt_rate'] * ((level - reference) - self.echo_gain)
+                self.echo_gain = min(10.0, max(-60.0, self.echo_gain))
+            else:
+                self.noise_floor += self.settings['noise_adapt_rate'] * (level - self.noise_floor)
+        return self.counts['chunks'] > self.arm_chunks and self.voiced_run >= self.start_chunks
+
+    def stats(self):
+        return dict(self.counts, echo_gain_db=round(self.echo_gain, 1), noise_floor_dbfs=round(self.noise_floor, 1))
+
+class BargeInMonitor:
+    def __init__(self, pa, audio_settings, settings, loop, on_barge_in):
+        self.pa = pa
+        self.loop = loop
+        self.on_barge_in = on_barge_in
+        self.format = audio_settings['audio_format_pyaudio']
+        self.channels = audio_settings['channels']
+        self.rate = audio_settings['rate']
+        self.chunk = audio_settings['chunk_size']
+        self.detector = BargeInDetector(settings, self.rate, self.chunk)
+        self.lock = Lock()
+        self.stream = None
+        self.opener = None
+        self.closed = False
+        self.captured = None
+        self.redirect = None
+        self.triggered_at = None
+
+    def start(self):
+        self.opener = asyncio.ensure_future(asyncio.to_thread(self._open))
+        return self.opener
+
+    def _open(self):
+        try:
+            stream = self.pa.open(format=self.format, channels=self.channels, rate=self.rate, input=True, frames_per_buffer=self.chunk, stream_callback=self._on_audio)
+        except Exception as e:
+            print(f"⚠️  Barge-in monitor could not open the microphone: {e}")
+            return
+        with self.lock:
+            if not self.closed:
+                self.stream = stream
+                return
+        self._close_stream(stream)
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        with self.lock:
+            redirect = self.redirect
+            if redirect is None:
+                if self.captured is not None:
+                    self.captured.append(in_data)
+                elif self.detector.process(in_data):
+                    self.captured = list(self.detector.preroll)
+                    self.triggered_at = time.perf_counter()
+                    try:
+                        self.loop.call_soon_threadsafe(self.on_barge_in, self)
+                    except RuntimeError:
+                        pass
+        if redirect is not None:
+            return redirect(in_data, frame_count, time_info, status)
+        return None, pyaudio.paContinue
+
+    async def handover(self, callback):
+        if self.opener is not None:
+            await self.opener
+        with self.lock:
+            for chunk in self.captured or []:
+                callback(chunk, len(chunk), None, None)
+            self.captured = None
+            self.redirect = callback
+            stream, self.stream = self.stream, None
+        return stream
+
+    def stop(self):
+        with self.lock:
+            self.closed = True
+            stream, self.stream = self.stream, None
+        if stream is not None:
+            self.loop.run_in_executor(None, self._close_stream, stream)
+
+    @staticmethod
+    def _close_stream(stream):
+        try:
+            stream.stop_stream()
+            stream.close()
+        except Exception as e:
+            print(f"⚠️  Could not close the barge-in monitor stream: {e}")
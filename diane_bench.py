@@ -0,0 +1,369 @@
+# diane_bench.py
+import os
+import sys
+import gc
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from queue import Queue
+
+import diane_script as diane
+from diane_fakes import FakeBackend, merge_settings, REPLY_SENTENCES
+from diane_tracing import percentile, STAGE_INTERVALS
+from diane_ssml import split_ssml
+from diane_startup import StartupProfile
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILES = {
+    'realistic': {'audio': {'speed': 20.0}},
+    'realtime': {},
+    'tail': {
+        'llm': {'model_first_byte_ms': {'pro': 1200, 'flash': 450, 'flash-lite': 250}, 'slow_rate': 0.15, 'slow_ms': 3000},
+        'audio': {'speed': 20.0},
+    },
+    'soak': {
+        'llm': {'first_byte_ms': 2, 'jitter_ms': 1, 'chunk_interval_ms': 0, 'reply_chars': 300, 'cache_create_ms': 5},
+        'tts': {'latency_ms': 1, 'jitter_ms': 0, 'ms_per_kb': 0, 'audio_ms_per_char': 2},
+        'stt': {'final_latency_ms': 1, 'jitter_ms': 0, 'interim_every_chunks': 1},
+        'audio': {'speed': 200.0},
+    },
+}
+
+class DiscardingQueue(Queue):
+    def __init__(self):
+        super().__init__()
+        self.discarded = 0
+
+    def put(self, item, block=True, timeout=None):
+        self.discarded += 1
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def process_usage():
+    if psutil:
+        process = psutil.Process()
+        handles = process.num_handles() if sys.platform == "win32" else process.num_fds()
+        return {'rss_bytes': process.memory_info().rss, 'threads': threading.active_count(), 'handles': handles}
+    usage = {'rss_bytes': None, 'threads': threading.active_count(), 'handles': None}
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            usage['rss_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        usage['handles'] = len(os.listdir('/proc/self/fd'))
+    return usage
+
+def make_large_ssml(target_bytes, shape='mixed'):
+    sentences, size, i = [], 0, 0
+    while size < target_bytes:
+        if shape == 'long_prosody':
+            sentence = REPLY_SENTENCES[3] + ' '
+        elif shape == 'well_formed':
+            sentence = REPLY_SENTENCES[i % len(REPLY_SENTENCES)] + ' <emphasis>really</emphasis> and <prosody rate="slow">truly</prosody> '
+        else:
+            sentence = REPLY_SENTENCES[i % len(REPLY_SENTENCES)] + ' <emphasis>really</emphasis> & <mods rate="slow">truly</mods> '
+        sentences.append(sentence)
+        size += len(sentence.encode('utf-8'))
+        i += 1
+    body = "".join(sentences)
+    if shape == 'long_prosody':
+        body = f'<prosody rate="slow" pitch="-2st">{body}</prosody>'
+    return "```xml\n<speak>" + body + "</speak>\n```"
+
+def timed(function, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, {'p50_ms': round(percentile(samples, 0.5), 3), 'p95_ms': round(percentile(samples, 0.95), 3), 'min_ms': round(samples[0], 3)}
+
+def bench_text_pipeline(sizes, repeats, byte_limit=4900, first_chunk_limit=600):
+    results = {}
+    for shape in ('mixed', 'well_formed', 'long_prosody'):
+        for size in sizes:
+            raw = make_large_ssml(size, shape)
+            sanitized, sanitize_stats = timed(lambda: diane.sanitize_ssml(raw), repeats)
+            chunks, split_stats = timed(lambda: split_ssml(sanitized, byte_limit, first_chunk_limit), repeats)
+            megabytes = len(raw.encode('utf-8')) / (1024 * 1024)
+            sanitize_stats['mb_per_s'] = round(megabytes / (sanitize_stats['p50_ms'] / 1000), 3) if sanitize_stats['p50_ms'] else None
+            split_stats['mb_per_s'] = round(megabytes / (split_stats['p50_ms'] / 1000), 3) if split_stats['p50_ms'] else None
+            chunk_bytes = [len(c.encode('utf-8')) for c in chunks]
+            over_limit = sum(1 for i, n in enumerate(chunk_bytes) if n > (first_chunk_limit if i == 0 else byte_limit))
+            key = str(size) if shape == 'mixed' else f"{shape}_{size}"
+            results[key] = {'input_bytes': len(raw.encode('utf-8')), 'sanitize': sanitize_stats, 'split': split_stats, 'chunks': len(chunks), 'max_chunk_bytes': max(chunk_bytes), 'over_limit_chunks': over_limit}
+            print(f"--- text pipeline {shape} {size} bytes: sanitize p50 {sanitize_stats['p50_ms']} ms, split p50 {split_stats['p50_ms']} ms, {len(chunks)} chunks, {over_limit} over limit ---")
+    return results
+
+def bench_config(workdir, profile, stt_encoding=None, tts_encoding=None):
+    loaded = diane.load_configuration()
+    if not loaded:
+        raise SystemExit("Could not load config.json for the benchmark.")
+    if stt_encoding or tts_encoding:
+        loaded['audio_settings'].update({key: value for key, value in (('stt_encoding', stt_encoding), ('tts_encoding', tts_encoding)) if value})
+    loaded['session_store'] = dict(loaded.get('session_store', {}), directory=os.path.join(workdir, "sessions"), resume=False)
+    loaded['tracing'] = dict(loaded.get('tracing', {}), directory=os.path.join(workdir, "logs"), summary_window=100000, status_readout=False)
+    loaded['tts_cache'] = dict(loaded.get('tts_cache', {}), enabled=False)
+    loaded['backend'] = {'provider': 'fake', 'fake': PROFILES[profile]}
+    return loaded
+
+async def wait_for_state(states, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while diane.app_state not in states:
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Timed out waiting for {states} (state is '{diane.app_state}').")
+        await asyncio.sleep(0.001)
+
+async def run_turn(index, model_key, voice, listen_seconds):
+    if voice:
+        diane.handle_start_voice(model_key, time.perf_counter())
+        trace = diane.current_trace
+        await asyncio.sleep(listen_seconds)
+        diane.handle_stop_listening()
+    else:
+        diane.handle_start_text(model_key)
+        diane.handle_send_request(f"Benchmark question number {index}, please answer briefly.", "awaiting_text", time.perf_counter())
+        trace = diane.current_trace
+    await wait_for_state(("idle",))
+    return trace.intervals() if trace else {}
+
+async def bench_turns(fake_backend, turns, voice_every, listen_seconds, model_key="flash"):
+    started = time.perf_counter()
+    for i in range(turns):
+        await run_turn(i, model_key, voice_every and i % voice_every == 0, listen_seconds)
+    elapsed = time.perf_counter() - started
+    stages = {}
+    for name, _, _ in STAGE_INTERVALS:
+        p50, p95, count = diane.tracer.summary(name)
+        if count:
+            stages[name] = {'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'count': count}
+    transfer = {'stt_encoding': diane.config['audio_settings']['stt_encoding'], 'tts_encoding': diane.config['audio_settings']['tts_encoding'], 'stt_upload_bytes': fake_backend.stt_upload_bytes, 'tts_download_bytes': fake_backend.tts_download_bytes}
+    print(f"--- transfer: STT {transfer['stt_encoding']} {transfer['stt_upload_bytes']} B up, TTS {transfer['tts_encoding']} {transfer['tts_download_bytes']} B down ---")
+    return {'turns': turns, 'elapsed_s': round(elapsed, 3), 'turns_per_s': round(turns / elapsed, 3), 'stages': stages, 'transfer': transfer, 'tracer_status': dict(diane.tracer.status_counts), 'context_cache': diane.cache_manager.stats(), 'speculation': diane.speculator.stats(), 'router': diane.router.stats(), 'summarizer': diane.summarizer.stats()}
+
+async def soak(turns, sample_every, voice_every, listen_seconds):
+    gc.collect()
+    samples = [dict(process_usage(), turn=0, history_turns=len(diane.master_history), history_tokens=int(diane.master_history.snapshot().total_tokens()))]
+    started = time.perf_counter()
+    for i in range(1, turns + 1):
+        await run_turn(i, "lite", voice_every and i % voice_every == 0, listen_seconds)
+        if i % sample_every == 0 or i == turns:
+            gc.collect()
+            samples.append(dict(process_usage(), turn=i, history_turns=len(diane.master_history), history_tokens=int(diane.master_history.snapshot().total_tokens())))
+            print(f"--- soak {i}/{turns}: {samples[-1]} ---")
+    warm = samples[1] if len(samples) > 2 else samples[0]
+    last = samples[-1]
+    growth = {key: (last[key] - warm[key]) if last.get(key) is not None and warm.get(key) is not None else None for key in ('rss_bytes', 'threads', 'handles')}
+    span = max(1, last['turn'] - warm['turn'])
+    return {
+        'turns': turns,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+        'samples': samples,
+        'growth_after_warmup': growth,
+        'rss_bytes_per_1000_turns': round(growth['rss_bytes'] * 1000 / span) if growth['rss_bytes'] is not None else None,
+    }
+
+IDLE_STAGES = ('llm_first_byte', 'tts_first_chunk', 'end_to_first_audio')
+
+async def bench_idle(fake_backend, warm_turns, idle_seconds, model_key="flash"):
+    warm = [await run_turn(i, model_key, False, 0) for i in range(warm_turns)]
+    print(f"--- idle: sleeping {idle_seconds}s before the next turn ---")
+    await asyncio.sleep(idle_seconds)
+    after_idle = await run_turn(warm_turns, model_key, False, 0)
+    stages = {}
+    for name in IDLE_STAGES:
+        values = sorted(turn[name] for turn in warm[1:] if name in turn)
+        stages[name] = {'first_turn_ms': warm[0].get(name), 'warm_p50_ms': round(percentile(values, 0.5), 2) if values else None, 'after_idle_ms': after_idle.get(name)}
+        print(f"--- idle {name:<20} first {stages[name]['first_turn_ms']} ms, warm p50 {stages[name]['warm_p50_ms']} ms, after {idle_seconds}s idle {stages[name]['after_idle_ms']} ms ---")
+    result = {'warm_turns': warm_turns, 'idle_seconds': idle_seconds, 'stages': stages, 'connects': fake_backend.connection_counts(diane.clients), 'connections': diane.connections.stats()}
+    print(f"--- idle: connects {result['connects']} ---")
+    return result
+
+async def bench_barge_in(turns, speech_delay_ms, echo_gain, model_key="flash"):
+    settings, mic = diane.config.setdefault('barge_in', {}), diane.audio_player.pa
+    saved = (settings.get('enabled', False), mic.mic_speech_delay_ms, mic.echo_gain)
+    settings['enabled'], mic.mic_speech_delay_ms, mic.echo_gain = True, speech_delay_ms, echo_gain
+    interruptions = []
+    try:
+        for i in range(turns):
+            diane.handle_start_text(model_key)
+            diane.handle_send_request(f"Barge-in question number {i}, please keep talking for a while.", "awaiting_text", time.perf_counter())
+            trace = diane.current_trace
+            await wait_for_state(("listening", "idle"))
+            if diane.app_state == "listening":
+                interruptions.append(trace.attrs.get('barge_in', {}))
+                diane.handle_cancel_action()
+                await wait_for_state(("idle",))
+    finally:
+        settings['enabled'], mic.mic_speech_delay_ms, mic.echo_gain = saved
+    heard = sorted(item['heard_s'] * 1000 for item in interruptions)
+    fractions = sorted(item['heard_fraction'] for item in interruptions)
+    result = {
+        'turns': turns,
+        'barge_ins': len(interruptions),
+        'speech_delay_ms': speech_delay_ms,
+        'heard_ms_p50': round(percentile(heard, 0.5), 1) if heard else None,
+        'detection_ms_p50': round(percentile(heard, 0.5) - speech_delay_ms, 1) if heard else None,
+        'heard_fraction_p50': round(percentile(fractions, 0.5), 3) if fractions else None,
+        'detector': interruptions[-1].get('detector') if interruptions else None,
+    }
+    print(f"--- barge-in: {result['barge_ins']}/{turns} replies interrupted, heard p50 {result['heard_ms_p50']} ms, detection p50 {result['detection_ms_p50']} ms after speech onset ---")
+    return result
+
+CANCEL_PHASES = ('listening', 'processing', 'speaking')
+
+async def bench_cancel(fake_backend, trials, model_key="flash"):
+    results = {}
+    for phase in CANCEL_PHASES:
+        latencies = []
+        for i in range(trials):
+            if phase == 'listening':
+                diane.handle_start_voice(model_key, time.perf_counter())
+            else:
+                diane.handle_start_text(model_key)
+                diane.handle_send_request(f"Cancel question number {i}, please keep talking for a while.", "awaiting_text", time.perf_counter())
+            trace = diane.current_trace
+            await wait_for_state((phase, "idle"))
+            await asyncio.sleep(0.05)
+            diane.handle_cancel_action(time.perf_counter())
+            await wait_for_state(("idle",))
+            if trace and 'cancel_to_idle' in trace.intervals():
+                latencies.append(trace.intervals()['cancel_to_idle'])
+            await asyncio.sleep(0.05)
+        latencies.sort()
+        results[phase] = {
+            'trials': trials,
+            'cancelled': len(latencies),
+            'p50_ms': round(percentile(latencies, 0.5), 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+            'max_ms': round(latencies[-1], 2) if latencies else None,
+        }
+        print(f"--- cancel while {phase:<10} {len(latencies)}/{trials} cancelled, cancel-to-idle p50 {results[phase]['p50_ms']} ms, p95 {results[phase]['p95_ms']} ms, max {results[phase]['max_ms']} ms ---")
+    await asyncio.sleep(0.2)
+    results['open_input_streams'] = sum(1 for stream in diane.audio_player.pa.open_streams if stream.is_input)
+    results['turn_running'] = diane.active_turn is not None and not diane.active_turn.done()
+    print(f"--- cancel: {results['open_input_streams']} input streams left open, turn still running: {results['turn_running']} ---")
+    return results
+
+def compare(current, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"--- Comparing against {baseline_path} ({baseline['meta'].get('git_revision')}) ---")
+    for section in ('turns',):
+        for stage, values in current.get(section, {}).get('stages', {}).items():
+            before = baseline.get(section, {}).get('stages', {}).get(stage)
+            if before:
+                print(f"    {stage:<20} p50 {before['p50_ms']:>9.2f} -> {values['p50_ms']:>9.2f} ms   p95 {before['p95_ms']:>9.2f} -> {values['p95_ms']:>9.2f} ms")
+        transfer, before = current.get(section, {}).get('transfer'), baseline.get(section, {}).get('transfer')
+        if transfer and before:
+            for key in ('stt_upload_bytes', 'tts_download_bytes'):
+                print(f"    {key:<20} {before[key]:>10} -> {transfer[key]:>10} B")
+    for phase, values in current.get('cancel', {}).items():
+        before = baseline.get('cancel', {}).get(phase)
+        if isinstance(values, dict) and before:
+            print(f"    cancel {phase:<13} p50 {before['p50_ms']} -> {values['p50_ms']} ms   p95 {before['p95_ms']} -> {values['p95_ms']} ms")
+    for name, phase in current.get('startup', {}).get('phases', {}).items():
+        before = baseline.get('startup', {}).get('phases', {}).get(name)
+        if before:
+            print(f"    startup {name:<12} {before['duration_ms']:>9.1f} -> {phase['duration_ms']:>9.1f} ms")
+    for size, values in current.get('text_pipeline', {}).items():
+        before = baseline.get('text_pipeline', {}).get(size)
+        if before:
+            print(f"    text {size:>8} B  sanitize {before['sanitize']['p50_ms']:>8.2f} -> {values['sanitize']['p50_ms']:>8.2f} ms   split {before['split']['p50_ms']:>8.2f} -> {values['split']['p50_ms']:>8.2f} ms")
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="diane_bench_")
+    loaded = bench_config(workdir, args.profile, args.stt_encoding, args.tts_encoding)
+    fake_settings = PROFILES[args.profile]
+    if 'idle' in args.suites:
+        fake_settings = merge_settings(fake_settings, {'connection': {'idle_timeout_ms': args.idle_seconds * 500}})
+        loaded['connections'] = dict(loaded.get('connections', {}), idle_ping_seconds=args.idle_seconds / 4)
+    if args.summary_tokens:
+        loaded['summarization'] = dict(loaded.get('summarization', {}), trigger_tokens=args.summary_tokens)
+    if args.route:
+        loaded['router'] = dict(loaded.get('router', {}), enabled=True)
+    if args.speculate:
+        loaded['speculation'] = dict(loaded.get('speculation', {}), enabled=True)
+    if args.no_keepalive:
+        loaded['connections'] = dict(loaded.get('connections', {}), prewarm=False, idle_ping_seconds=0)
+    os.chdir(workdir)
+    results = {'meta': {'git_revision': git_revision(), 'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"), 'python': platform.python_version(), 'platform': platform.platform(), 'profile': args.profile, 'connections': loaded.get('connections', {}), 'fake_settings': merge_settings(FakeBackend().settings, fake_settings)}}
+    if 'text' in args.suites:
+        results['text_pipeline'] = bench_text_pipeline(args.sizes, args.repeats)
+    if {'turns', 'soak', 'idle', 'bargein', 'cancel'} & set(args.suites):
+        ui_sink = DiscardingQueue()
+        fake_backend = FakeBackend(fake_settings)
+        profile = StartupProfile()
+        if not await diane.start_runtime(loaded, fake_backend, ui_sink, profile):
+            raise SystemExit("Fake runtime failed to start.")
+        profile.mark('ready')
+        profile.report()
+        results['startup'] = profile.as_dict()
+        diane.set_application_state("idle")
+        if 'turns' in args.suites:
+            results['turns'] = await bench_turns(fake_backend, args.turns, args.voice_every, args.listen_seconds, args.model)
+        if 'idle' in args.suites:
+            results['idle'] = await bench_idle(fake_backend, args.idle_warm_turns, args.idle_seconds)
+        if 'bargein' in args.suites:
+            results['barge_in'] = await bench_barge_in(args.barge_turns, args.barge_delay_ms, args.echo_gain)
+        if 'cancel' in args.suites:
+            results['cancel'] = await bench_cancel(fake_backend, args.cancel_trials)
+        if 'soak' in args.suites:
+            results['soak'] = await soak(args.soak_turns, args.sample_every, args.voice_every, args.listen_seconds)
+        diane.session_store.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency benchmark and soak test for Diane, using local fake backends.")
+    parser.add_argument('--suites', nargs='+', default=['text', 'turns'], choices=['text', 'turns', 'soak', 'idle', 'bargein', 'cancel'])
+    parser.add_argument('--profile', default='realistic', choices=sorted(PROFILES))
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--voice-every', type=int, default=2, help="Make every Nth turn a voice turn (0 for text only).")
+    parser.add_argument('--listen-seconds', type=float, default=0.5)
+    parser.add_argument('--soak-turns', type=int, default=3000)
+    parser.add_argument('--sample-every', type=int, default=250)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000, 100000])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--stt-encoding', default=None, help="Override audio_settings.stt_encoding (LINEAR16, FLAC, OGG_OPUS).")
+    parser.add_argument('--tts-encoding', default=None, help="Override audio_settings.tts_encoding (LINEAR16, OGG_OPUS, MP3).")
+    parser.add_argument('--idle-seconds', type=float, default=8.0, help="Idle gap for the idle suite; fake connections go cold after half of it.")
+    parser.add_argument('--idle-warm-turns', type=int, default=5)
+    parser.add_argument('--no-keepalive', action='store_true', help="Disable connection pre-warming and idle pings.")
+    parser.add_argument('--barge-turns', type=int, default=5)
+    parser.add_argument('--barge-delay-ms', type=float, default=1500, help="Fake mic speech starts this long after a stream opens (bargein suite).")
+    parser.add_argument('--echo-gain', type=float, default=0.0, help="Fraction of playback the fake mic picks up as echo (bargein suite).")
+    parser.add_argument('--cancel-trials', type=int, default=5, help="Cancels per phase (listening, processing, speaking) for the cancel suite.")
+    parser.add_argument('--model', default='flash', help="Model key the turns suite asks.")
+    parser.add_argument('--summary-tokens', type=int, default=None, help="Override summarization.trigger_tokens (history size that starts a background summary).")
+    parser.add_argument('--route', action='store_true', help="Enable the latency-budget router with hedged requests.")
+    parser.add_argument('--speculate', action='store_true', help="Enable speculative LLM dispatch on stable interim transcripts.")
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None, help="Earlier results JSON to diff against.")
+    args = parser.parse_args()
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    output = os.path.abspath(args.output or os.path.join(repo_dir, "bench_results", f"bench_{git_revision() or 'local'}_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(repo_dir)
+    results = asyncio.run(run(args))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Benchmark results written to '{output}'")
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == '__main__':
+    main()
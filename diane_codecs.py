@@ -0,0 +1,95 @@
+# diane_codecs.py
+import io
+
+soundfile = None
+_soundfile_checked = False
+
+STT_ENCODINGS = {'LINEAR16': None, 'FLAC': ('FLAC', 'PCM_16'), 'OGG_OPUS': ('OGG', 'OPUS')}
+TTS_ENCODINGS = {'LINEAR16': None, 'OGG_OPUS': ('OGG', 'OPUS'), 'MP3': ('MP3', None)}
+FILE_EXTENSIONS = {'LINEAR16': 'wav', 'FLAC': 'flac', 'OGG_OPUS': 'ogg', 'MP3': 'mp3'}
+
+def load_soundfile():
+    global soundfile, _soundfile_checked
+    if not _soundfile_checked:
+        _soundfile_checked = True
+        try:
+            import soundfile
+        except (ImportError, OSError):
+            soundfile = None
+    return soundfile
+
+def resolve_encoding(requested, supported, purpose):
+    requested = str(requested or 'LINEAR16').upper()
+    if requested not in supported:
+        print(f"⚠️  Unknown {purpose} encoding '{requested}'. Falling back to LINEAR16.")
+        return 'LINEAR16'
+    container = supported[requested]
+    if container is None:
+        return requested
+    if load_soundfile() is None:
+        print(f"⚠️  {purpose} encoding {requested} needs the 'soundfile' package. Falling back to LINEAR16.")
+        return 'LINEAR16'
+    major, subtype = container
+    if major not in soundfile.available_formats() or (subtype and subtype not in soundfile.available_subtypes(major)):
+        print(f"⚠️  The installed libsndfile cannot handle {requested}. Falling back to LINEAR16 for {purpose}.")
+        return 'LINEAR16'
+    return requested
+
+class _ByteSink:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.sent = 0
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def read(self, size=-1):
+        return self.buffer.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.buffer.seek(offset, whence)
+
+    def tell(self):
+        return self.buffer.tell()
+
+    def drain(self):
+        with self.buffer.getbuffer() as view:
+            fresh = bytes(view[self.sent:])
+            self.sent = len(view)
+        return fresh
+
+class StreamingEncoder:
+    def __init__(self, encoding, rate, channels):
+        major, subtype = STT_ENCODINGS[encoding]
+        self.encoding = encoding
+        self.sink = _ByteSink()
+        self.file = load_soundfile().SoundFile(self.sink, mode='w', samplerate=rate, channels=channels, format=major, subtype=subtype)
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+
+    def encode(self, pcm):
+        self.file.buffer_write(pcm, dtype='int16')
+        self.raw_bytes += len(pcm)
+        return self._drain()
+
+    def finish(self):
+        if not self.file.closed:
+            self.file.close()
+        return self._drain()
+
+    def _drain(self):
+        fresh = self.sink.drain()
+        self.encoded_bytes += len(fresh)
+        return fresh
+
+def decode_audio(data):
+    with load_soundfile().SoundFile(io.BytesIO(data)) as f:
+        pcm = f.buffer_read(dtype='int16')
+        return bytes(pcm), 2, f.channels, f.samplerate
+
+def encode_audio(pcm, rate, channels, encoding):
+    major, subtype = TTS_ENCODINGS.get(encoding) or STT_ENCODINGS[encoding]
+    output = io.BytesIO()
+    with load_soundfile().SoundFile(output, mode='w', samplerate=rate, channels=channels, format=major, subtype=subtype) as f:
+        f.buffer_write(pcm, dtype='int16')
+    return output.getvalue()
@@ -0,0 +1,93 @@
+# diane_connections.py
+import time
+import asyncio
+from collections import OrderedDict
+
+class ConnectionManager:
+    def __init__(self, backend, clients, models, system_instruction, settings=None):
+        settings = settings or {}
+        self.backend = backend
+        self.tts_client, self.speech_client = clients
+        self.model_names = models
+        self.system_instruction = system_instruction
+        self.prewarm = settings.get('prewarm', True)
+        self.idle_ping_seconds = settings.get('idle_ping_seconds', 45)
+        self.warm_timeout = settings.get('warm_timeout_seconds', 10)
+        self.models = OrderedDict()
+        self.last_activity = time.monotonic()
+        self.last_model_key = next(iter(models), None)
+        self.task = None
+        self.warm_ms = {}
+        self.counts = {'warmups': 0, 'pings': 0, 'ping_failures': 0, 'model_reuses': 0, 'model_builds': 0}
+
+    def start(self):
+        if self.prewarm or self.idle_ping_seconds:
+            self.task = asyncio.create_task(self._run())
+        return self.task
+
+    def touch(self, model_key=None):
+        self.last_activity = time.monotonic()
+        if model_key:
+            self.last_model_key = model_key
+
+    def model(self, model_key, cache=None):
+        cache_name = getattr(cache, 'name', None) if cache is not None else None
+        key = (model_key, cache_name)
+        model = self.models.get(key)
+        if model is not None:
+            self.models.move_to_end(key)
+            self.counts['model_reuses'] += 1
+            return model
+        for stale_key in [k for k in self.models if k[0] == model_key and k[1] is not None and k[1] != cache_name]:
+            del self.models[stale_key]
+        if cache is None:
+            model = self.backend.generative_model(self.model_names[model_key], self.system_instruction)
+        else:
+            model = self.backend.model_from_cache(cache)
+        self.models[key] = model
+        self.counts['model_builds'] += 1
+        return model
+
+    def stats(self):
+        return dict(self.counts, warm_ms=dict(self.warm_ms), cached_models=len(self.models))
+
+    async def warm_all(self, reason="startup"):
+        started = time.perf_counter()
+        jobs = [('tts', self.backend.warm_tts(self.tts_client)), ('stt', self.backend.warm_stt(self.speech_client))]
+        jobs += [(f"llm:{key}", self.backend.warm_llm(self.model(key))) for key in self.model_names]
+        results = await asyncio.gather(*(self._timed(name, job) for name, job in jobs))
+        failed = [name for name, ok in zip((name for name, _ in jobs), results) if not ok]
+        self.counts['warmups'] += 1
+        print(f"--- Connections warmed ({reason}) in {(time.perf_counter() - started) * 1000:.0f} ms: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.warm_ms.items()) + (f"; failed: {', '.join(failed)}" if failed else "") + " ---")
+
+    async def ping(self):
+        jobs = [('tts', self.backend.warm_tts(self.tts_client)), ('stt', self.backend.warm_stt(self.speech_client))]
+        if self.last_model_key in self.model_names:
+            jobs.append((f"llm:{self.last_model_key}", self.backend.warm_llm(self.model(self.last_model_key))))
+        results = await asyncio.gather(*(self._timed(name, job) for name, job in jobs))
+        self.counts['pings'] += 1
+        self.counts['ping_failures'] += results.count(False)
+
+    async def _timed(self, name, job):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(job, self.warm_timeout)
+            self.warm_ms[name] = (time.perf_counter() - started) * 1000
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️  Connection warm-up for {name} failed: {e}")
+            return False
+
+    async def _run(self):
+        if self.prewarm:
+            await self.warm_all()
+        if not self.idle_ping_seconds:
+            return
+        while True:
+            idle_for = time.monotonic() - self.last_activity
+            await asyncio.sleep(max(0.1, self.idle_ping_seconds - idle_for))
+            if time.monotonic() - self.last_activity >= self.idle_ping_seconds:
+                await self.ping()
+                self.last_activity = time.monotonic()
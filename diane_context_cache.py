@@ -0,0 +1,181 @@
+# diane_context_cache.py
+import time
+import datetime
+import threading
+from diane_startup import LazyModule
+
+genai = LazyModule('google.generativeai')
+
+class ContextCacheManager(threading.Thread):
+    def __init__(self, models, system_instruction, history, thresholds, settings=None, create_cache=None):
+        super().__init__(daemon=True, name="ContextCacheManager")
+        settings = settings or {}
+        self.create_cache = create_cache or self._create_gemini_cache
+        self.models = models
+        self.system_instruction = system_instruction
+        self.history = history
+        self.min_tokens, self.compaction_turns, self.diff_token_threshold = thresholds
+        self.ttl_seconds = settings.get('ttl_seconds', 3600)
+        self.refresh_margin = settings.get('refresh_margin_seconds', 300)
+        self.idle_release = settings.get('idle_release_seconds', 1800)
+        self.check_interval = settings.get('check_interval_seconds', 30)
+        self.proactive_fraction = settings.get('proactive_rebuild_fraction', 0.75)
+        self.retire_grace = settings.get('retire_grace_seconds', 120)
+        self.condition = threading.Condition()
+        self.model_caches = {}
+        self.cache_source_lens = {}
+        self.expire_at = {}
+        self.last_used = {}
+        self.retry_after = {}
+        self.retired = []
+        self.rebuild_count = 0
+        self.rebuild_failures = 0
+        self.rebuild_seconds_total = 0.0
+        self.last_rebuild_seconds = 0.0
+        self.extension_count = 0
+        self.cached_requests = 0
+        self.uncached_requests = 0
+
+    def acquire(self, model_key):
+        with self.condition:
+            self.last_used[model_key] = time.time()
+            cache = self.model_caches.get(model_key)
+            if cache is None or self.expire_at.get(model_key, 0) <= time.time() + 5:
+                return None, 0
+            return cache, self.cache_source_lens[model_key]
+
+    def record_request(self, model_key, cached):
+        with self.condition:
+            if cached:
+                self.cached_requests += 1
+            else:
+                self.uncached_requests += 1
+
+    def notify_history_changed(self, model_key=None):
+        with self.condition:
+            if model_key:
+                self.last_used[model_key] = time.time()
+            self.condition.notify_all()
+
+    def invalidate(self, model_key, cache):
+        with self.condition:
+            if self.model_caches.get(model_key) is cache:
+                self._drop(model_key)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            requests = self.cached_requests + self.uncached_requests
+            return {
+                'rebuild_count': self.rebuild_count,
+                'rebuild_failures': self.rebuild_failures,
+                'last_rebuild_seconds': round(self.last_rebuild_seconds, 3),
+                'avg_rebuild_seconds': round(self.rebuild_seconds_total / self.rebuild_count, 3) if self.rebuild_count else 0.0,
+                'extension_count': self.extension_count,
+                'cached_requests': self.cached_requests,
+                'uncached_requests': self.uncached_requests,
+                'cached_share': self.cached_requests / requests if requests else 0.0,
+                'live_caches': sorted(self.model_caches),
+            }
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait(timeout=self.check_interval)
+                now = time.time()
+                active_models = [key for key, used in self.last_used.items() if now - used < self.idle_release]
+                for model_key in list(self.model_caches):
+                    if self.expire_at.get(model_key, 0) <= now:
+                        print(f"--- Context cache for '{model_key.upper()}' expired. Dropping local reference. ---")
+                        self._drop(model_key)
+            for model_key in active_models:
+                try:
+                    self._maintain(model_key, now)
+                except Exception as e:
+                    print(f"⚠️  Context cache maintenance failed for '{model_key}': {e}")
+            self._delete_retired(now)
+
+    def _maintain(self, model_key, now):
+        if now < self.retry_after.get(model_key, 0) or model_key not in self.models:
+            return
+        reason, snapshot = self._rebuild_reason(model_key)
+        if reason:
+            self._rebuild(model_key, reason, snapshot)
+            return
+        with self.condition:
+            cache = self.model_caches.get(model_key)
+            expiring = cache is not None and self.expire_at[model_key] - now < self.refresh_margin
+        if expiring:
+            cache.update(ttl=datetime.timedelta(seconds=self.ttl_seconds))
+            with self.condition:
+                if self.model_caches.get(model_key) is cache:
+                    self.expire_at[model_key] = time.time() + self.ttl_seconds
+                self.extension_count += 1
+            print(f"--- Context cache for '{model_key.upper()}' extended by {self.ttl_seconds}s. ---")
+
+    def _rebuild_reason(self, model_key):
+        snapshot = self.history.snapshot()
+        snapshot_len = len(snapshot) if snapshot.last_role() == 'model' else len(snapshot) - 1
+        if snapshot.total_tokens() < self.min_tokens or snapshot_len <= 0:
+            return None, None
+        with self.condition:
+            has_cache = model_key in self.model_caches
+            source_len = snapshot.live_length(self.cache_source_lens.get(model_key, 0))
+        if not has_cache:
+            return f"NEW CACHE for '{model_key.upper()}'", snapshot
+        if source_len is None:
+            return f"CACHE REBASE: History was summarized past the cached turns for '{model_key.upper()}'", snapshot
+        diff_turns = len(snapshot) - source_len
+        diff_tokens = snapshot.range_tokens(source_len)
+        if snapshot_len <= source_len:
+            return None, None
+        if diff_turns >= self.compaction_turns * self.proactive_fraction:
+            return f"CACHE COMPACTION: Diff of {diff_turns} turns nearing threshold ({self.compaction_turns})", snapshot
+        if diff_tokens >= self.diff_token_threshold * self.proactive_fraction:
+            return f"CACHE COMPACTION: Diff tokens ({int(diff_tokens)}) nearing threshold ({self.diff_token_threshold})", snapshot
+        return None, None
+
+    def _rebuild(self, model_key, reason, snapshot):
+        snapshot_len = len(snapshot) if snapshot.last_role() == 'model' else len(snapshot) - 1
+        contents = snapshot.turns(0, snapshot_len)
+        print(f"--- BACKGROUND REBUILD: {reason}. Caching {snapshot_len} turns of history v{snapshot.version}... ---")
+        started = time.perf_counter()
+        try:
+            new_cache = self.create_cache(self.models[model_key], self.system_instruction, contents, datetime.timedelta(seconds=self.ttl_seconds))
+        except Exception as e:
+            with self.condition:
+                self.rebuild_failures += 1
+                self.retry_after[model_key] = time.time() + self.check_interval * 2
+            print(f"⚠️  Background cache rebuild for '{model_key}' failed: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        with self.condition:
+            old_cache = self.model_caches.get(model_key)
+            if old_cache is not None:
+                self.retired.append((time.time() + self.retire_grace, old_cache))
+            self.model_caches[model_key] = new_cache
+            self.cache_source_lens[model_key] = snapshot.raw_length(snapshot_len)
+            self.expire_at[model_key] = time.time() + self.ttl_seconds
+            self.rebuild_count += 1
+            self.rebuild_seconds_total += elapsed
+            self.last_rebuild_seconds = elapsed
+        print(f"✅ Context cache for '{model_key.upper()}' ready in {elapsed:.2f}s. Stats: {self.stats()}")
+
+    @staticmethod
+    def _create_gemini_cache(model_name, system_instruction, contents, ttl):
+        return genai.caching.CachedContent.create(model=f"models/{model_name}", system_instruction=system_instruction, contents=contents, ttl=ttl)
+
+    def _drop(self, model_key):
+        self.model_caches.pop(model_key, None)
+        self.cache_source_lens.pop(model_key, None)
+        self.expire_at.pop(model_key, None)
+
+    def _delete_retired(self, now):
+        with self.condition:
+            due = [cache for delete_at, cache in self.retired if delete_at <= now]
+            self.retired = [(delete_at, cache) for delete_at, cache in self.retired if delete_at > now]
+        for cache in due:
+            try:
+                cache.delete()
+            except Exception as e:
+                print(f"⚠️  Could not delete old cache (it may have already expired): {e}")
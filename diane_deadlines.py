@@ -0,0 +1,55 @@
+# diane_deadlines.py
+import asyncio
+
+DEFAULT_DEADLINES = {
+    'llm_first_byte_s': 20.0,
+    'llm_total_s': 120.0,
+    'tts_chunk_s': 20.0,
+    'stt_final_s': 5.0,
+    'cancel_budget_ms': 50,
+    'cancel_grace_ms': 500,
+}
+
+class StageTimeout(Exception):
+    def __init__(self, stage, seconds):
+        super().__init__(f"{stage} exceeded its {seconds:g}s deadline")
+        self.stage = stage
+        self.seconds = seconds
+
+async def wait_stage(awaitable, stage, seconds):
+    if not seconds:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise StageTimeout(stage, seconds) from None
+
+async def stream_with_deadlines(aiterable, stage, first_item_s=None, total_s=None):
+    iterator = aiterable.__aiter__()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + total_s if total_s else None
+    first = True
+    try:
+        while True:
+            timeout, limit = None, None
+            if deadline is not None:
+                timeout, limit = max(0.0, deadline - loop.time()), (f"{stage}_total", total_s)
+            if first and first_item_s and (timeout is None or first_item_s < timeout):
+                timeout, limit = first_item_s, (f"{stage}_first_byte", first_item_s)
+            try:
+                item = await (asyncio.wait_for(iterator.__anext__(), timeout) if timeout is not None else iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise StageTimeout(*limit) from None
+            first = False
+            yield item
+    finally:
+        closer = getattr(iterator, 'aclose', None) or getattr(aiterable, 'cancel', None)
+        if closer is not None:
+            try:
+                result = closer()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                pass
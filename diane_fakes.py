@@ -0,0 +1,387 @@
+# diane_fakes.py
+import math
+import time
+import copy
+import struct
+import random
+import asyncio
+import threading
+from array import array
+from types import SimpleNamespace
+
+DEFAULT_FAKE_SETTINGS = {
+    'seed': 1234,
+    'llm': {'first_byte_ms': 350, 'jitter_ms': 80, 'chunk_interval_ms': 40, 'chunk_chars': 60, 'reply_chars': 400, 'failure_rate': 0.0, 'cache_create_ms': 800, 'model_first_byte_ms': {}, 'slow_rate': 0.0, 'slow_ms': 0},
+    'tts': {'latency_ms': 180, 'jitter_ms': 40, 'ms_per_kb': 40, 'audio_ms_per_char': 65, 'sample_rate': 24000, 'downlink_kbps': 4000, 'failure_rate': 0.0},
+    'stt': {'interim_every_chunks': 4, 'final_latency_ms': 250, 'jitter_ms': 50, 'failure_rate': 0.0, 'utterances': ["What's the weather like on the moon today?", "Tell me something strange about owls.", "Summarize what we talked about so far."]},
+    'connection': {'connect_ms': 250, 'idle_timeout_ms': 240000},
+    'audio': {'speed': 1.0, 'mic_speech_ms': 1200, 'mic_speech_amplitude': 4000, 'mic_noise_amplitude': 20, 'mic_speech_delay_ms': 0, 'echo_gain': 0.0},
+}
+
+REPLY_SENTENCES = [
+    'Oh, <prosody rate="fast">that one again</prosody>.',
+    '<prosody pitch="-3st">Fine.</prosody><break time="300ms"/> Here is the short version.',
+    'The moon has no weather to speak of, which is <prosody rate="slow">frankly</prosody> restful.',
+    'Owls can turn their heads about two hundred and seventy degrees.',
+    '<prosody pitch="+4st">Isn\'t that wonderful?</prosody><break time="200ms"/> No? Noted.',
+]
+
+FORMAT_WIDTHS = {1: 4, 2: 4, 4: 3, 8: 2, 16: 1, 32: 1}
+WIDTH_FORMATS = {4: 2, 3: 4, 2: 8, 1: 16}
+
+def merge_settings(defaults, overrides):
+    merged = copy.deepcopy(defaults)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_settings(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def estimate_tokens(contents):
+    chars = 0
+    for turn in contents:
+        turn = turn if isinstance(turn, dict) else turn.materialize()
+        chars += sum(len(str(part.get('text', ''))) for part in turn.get('parts', []))
+    return max(1, chars // 4)
+
+def make_wav(pcm, sample_rate, channels=1, sample_width=2):
+    byte_rate = sample_rate * channels * sample_width
+    header = b'RIFF' + struct.pack('<I', 36 + len(pcm)) + b'WAVE'
+    header += b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, byte_rate, channels * sample_width, 8 * sample_width)
+    return header + b'data' + struct.pack('<I', len(pcm)) + pcm
+
+class FakeLatency:
+    def __init__(self, rng, jitter_ms=0, failure_rate=0.0, label="fake"):
+        self.rng = rng
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.label = label
+
+    def seconds(self, base_ms):
+        return max(0.0, base_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    async def wait(self, base_ms):
+        await asyncio.sleep(self.seconds(base_ms))
+
+    def maybe_fail(self):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise RuntimeError(f"503 Service Unavailable (injected {self.label} failure)")
+
+class FakeConnection:
+    def __init__(self, backend, label):
+        self.backend = backend
+        self.label = label
+        self.settings = backend.settings['connection']
+        self.last_used = None
+        self.connecting = None
+        self.connects = 0
+
+    async def use(self):
+        now = time.perf_counter()
+        if self.connecting is None and (self.last_used is None or (now - self.last_used) * 1000 > self.settings['idle_timeout_ms']):
+            self.connects += 1
+            self.connecting = asyncio.ensure_future(asyncio.sleep(self.settings['connect_ms'] / 1000))
+            self.connecting.add_done_callback(lambda _: setattr(self, 'connecting', None))
+        if self.connecting is not None:
+            await asyncio.shield(self.connecting)
+        self.last_used = time.perf_counter()
+
+class FakeCachedContent:
+    def __init__(self, backend, model_name, contents, ttl):
+        self.backend = backend
+        self.model_name = model_name
+        self.token_count = estimate_tokens(contents)
+        self.name = f"cachedContents/fake-{id(self):x}"
+        self.expire_time = time.time() + ttl.total_seconds()
+        self.deleted = False
+
+    def update(self, ttl):
+        if not self.is_live():
+            raise RuntimeError("404 CachedContent not found (fake)")
+        self.expire_time = time.time() + ttl.total_seconds()
+
+    def delete(self):
+        self.deleted = True
+        self.backend.live_caches.discard(self)
+
+    def is_live(self):
+        return not self.deleted and self.expire_time > time.time()
+
+class FakeStreamResponse:
+    def __init__(self, model, text, usage):
+        self.model = model
+        self.full_text = text
+        self.usage_metadata = usage
+        self.text = ""
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        settings = self.model.settings
+        step = max(1, settings['chunk_chars'])
+        for start in range(0, len(self.full_text), step):
+            if start:
+                await self.model.latency.wait(settings['chunk_interval_ms'])
+            piece = self.full_text[start:start + step]
+            self.text += piece
+            yield SimpleNamespace(text=piece)
+
+class FakeGenerativeModel:
+    def __init__(self, backend, model_name, cache=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.cache = cache
+        self.settings = backend.settings['llm']
+        self.latency = FakeLatency(backend.rng, self.settings['jitter_ms'], self.settings['failure_rate'], "generate_content")
+        overrides = self.settings.get('model_first_byte_ms', {})
+        match = max((name for name in overrides if name in model_name), key=len, default=None)
+        self.first_byte_ms = overrides[match] if match else self.settings['first_byte_ms']
+
+    def _first_byte_ms(self):
+        if self.settings.get('slow_rate') and self.backend.rng.random() < self.settings['slow_rate']:
+            return self.first_byte_ms + self.settings['slow_ms']
+        return self.first_byte_ms
+
+    async def count_tokens_async(self, contents):
+        await self.backend.llm_connection.use()
+        await self.latency.wait(self.settings['first_byte_ms'] / 4)
+        return SimpleNamespace(total_tokens=estimate_tokens([{'parts': [{'text': contents}]}]))
+
+    async def generate_content_async(self, contents, stream=False):
+        await self.backend.llm_connection.use()
+        await self.latency.wait(self._first_byte_ms())
+        if self.cache is not None and not self.cache.is_live():
+            raise RuntimeError("404 CachedContent not found (or permission denied)")
+        self.latency.maybe_fail()
+        reply = self.backend.compose_reply(self.settings['reply_chars'])
+        cached_tokens = self.cache.token_count if self.cache is not None else 0
+        usage = SimpleNamespace(prompt_token_count=estimate_tokens(contents) + cached_tokens, cached_content_token_count=cached_tokens, candidates_token_count=max(1, len(reply) // 4))
+        self.backend.generate_calls += 1
+        if stream:
+            return FakeStreamResponse(self, reply, usage)
+        await self.latency.wait(self.settings['chunk_interval_ms'] * (len(reply) // max(1, self.settings['chunk_chars'])))
+        return SimpleNamespace(text=reply, usage_metadata=usage)
+
+def make_voice_pattern(rng, rate, seconds=1.0):
+    samples = int(rate * seconds)
+    envelope = [0.4 + 0.6 * abs(math.sin(math.pi * 3 * i / samples)) for i in range(samples)]
+    return array('h', (int(envelope[i] * (2500 * math.sin(2 * math.pi * 180 * i / rate) + rng.gauss(0, 600))) for i in range(samples))).tobytes()
+
+def encoding_name(value, names=('LINEAR16', 'OGG_OPUS', 'MP3', 'FLAC')):
+    name = getattr(value, 'name', None)
+    if name:
+        return name
+    from google.cloud import texttospeech
+    return next((n for n in names if getattr(texttospeech.AudioEncoding, n, None) == value), 'LINEAR16')
+
+class FakeTTSClient:
+    def __init__(self, backend):
+        self.backend = backend
+        self.settings = backend.settings['tts']
+        self.latency = FakeLatency(backend.rng, self.settings['jitter_ms'], self.settings['failure_rate'], "synthesize_speech")
+        self.voice_pattern = make_voice_pattern(random.Random(backend.settings['seed']), self.settings['sample_rate'])
+        self.connection = FakeConnection(backend, "tts")
+
+    async def list_voices(self, language_code=None):
+        await self.connection.use()
+        await self.latency.wait(self.settings['latency_ms'] / 4)
+        return SimpleNamespace(voices=[])
+
+    async def synthesize_speech(self, input, voice, audio_config):
+        await self.connection.use()
+        ssml = input.ssml
+        rate = self.settings['sample_rate']
+        frames = int(rate * len(ssml) * self.settings['audio_ms_per_char'] / 1000)
+        pcm = (self.voice_pattern * (2 * frames // len(self.voice_pattern) + 1))[:2 * frames]
+        encoding = encoding_name(audio_config.audio_encoding)
+        if encoding == 'LINEAR16':
+            audio_content = make_wav(pcm, rate)
+        else:
+            from diane_codecs import encode_audio
+            audio_content = await asyncio.to_thread(encode_audio, pcm, rate, 1, encoding)
+        transfer_ms = self.settings['ms_per_kb'] * len(ssml.encode('utf-8')) / 1024 + len(audio_content) * 8 / max(1, self.settings['downlink_kbps'])
+        await self.latency.wait(self.settings['latency_ms'] + transfer_ms)
+        self.latency.maybe_fail()
+        self.backend.synthesize_calls += 1
+        self.backend.tts_download_bytes += len(audio_content)
+        return SimpleNamespace(audio_content=audio_content)
+
+class FakeSpeechClient:
+    def __init__(self, backend):
+        self.backend = backend
+        self.settings = backend.settings['stt']
+        self.latency = FakeLatency(backend.rng, self.settings['jitter_ms'], self.settings['failure_rate'], "streaming_recognize")
+        self.utterance_index = 0
+        self.connection = FakeConnection(backend, "stt")
+
+    async def streaming_recognize(self, requests):
+        await self.connection.use()
+        utterance = self.settings['utterances'][self.utterance_index % len(self.settings['utterances'])]
+        self.utterance_index += 1
+        return self._recognize(requests, utterance.split())
+
+    async def _recognize(self, requests, words):
+        audio_chunks, spoken = 0, 0
+        async for request in requests:
+            if not getattr(request, 'audio_content', None):
+                continue
+            audio_chunks += 1
+            self.backend.stt_upload_bytes += len(request.audio_content)
+            if audio_chunks % max(1, self.settings['interim_every_chunks']) == 0 and spoken < len(words):
+                spoken += 1
+                yield self._response(' '.join(words[:spoken]), False)
+            self.latency.maybe_fail()
+        await self.latency.wait(self.settings['final_latency_ms'])
+        if spoken:
+            yield self._response(' '.join(words), True)
+
+    @staticmethod
+    def _response(transcript, is_final):
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[SimpleNamespace(transcript=transcript)], is_final=is_final)])
+
+class NullAudioStream:
+    def __init__(self, interface, sample_width, channels, rate, is_input, frames_per_buffer, stream_callback):
+        self.interface = interface
+        self.frame_bytes = sample_width * channels
+        self.rate = rate
+        self.is_input = is_input
+        self.frames_per_buffer = frames_per_buffer
+        self.stream_callback = stream_callback
+        self.frames_processed = 0
+        self.running = threading.Event()
+        self.thread = None
+        if stream_callback:
+            self.running.set()
+            self.thread = threading.Thread(target=self._run, daemon=True, name="NullAudioStream")
+            self.thread.start()
+
+    def _run(self):
+        period = self.frames_per_buffer / self.rate / self.interface.speed
+        samples = self.frames_per_buffer * self.frame_bytes // 2
+        speech = array('h', (self.interface.mic_speech_amplitude * (1 if (i // 20) % 2 else -1) for i in range(samples))).tobytes()
+        noise = array('h', (self.interface.mic_noise_amplitude * (1 if i % 2 else -1) for i in range(samples))).tobytes()
+        speech_start = self.rate * self.interface.mic_speech_delay_ms / 1000
+        speech_end = speech_start + self.rate * self.interface.mic_speech_ms / 1000
+        next_tick = time.perf_counter()
+        while self.running.is_set():
+            in_data = None
+            if self.is_input:
+                in_data = self.interface.add_echo(speech if speech_start <= self.frames_processed < speech_end else noise)
+            result = self.stream_callback(in_data, self.frames_per_buffer, {}, 0)
+            if not self.is_input and result:
+                self.interface.last_output = result[0]
+            self.frames_processed += self.frames_per_buffer
+            next_tick += period
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    def read(self, frames, exception_on_overflow=True):
+        time.sleep(frames / self.rate / self.interface.speed)
+        return bytes(frames * self.frame_bytes)
+
+    def write(self, data):
+        time.sleep(len(data) / self.frame_bytes / self.rate / self.interface.speed)
+
+    def stop_stream(self):
+        self.running.clear()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+
+    def close(self):
+        self.stop_stream()
+        self.interface.open_streams.discard(self)
+
+class NullAudioInterface:
+    def __init__(self, speed=1.0, mic_speech_ms=0, mic_speech_amplitude=0, mic_noise_amplitude=0, mic_speech_delay_ms=0, echo_gain=0.0):
+        self.speed = speed
+        self.mic_speech_ms = mic_speech_ms
+        self.mic_speech_amplitude = mic_speech_amplitude
+        self.mic_noise_amplitude = mic_noise_amplitude
+        self.mic_speech_delay_ms = mic_speech_delay_ms
+        self.echo_gain = echo_gain
+        self.last_output = b""
+        self.open_streams = set()
+
+    def add_echo(self, in_data):
+        output = self.last_output
+        if not self.echo_gain or not output:
+            return in_data
+        mic, echo = array('h', in_data), array('h', output)
+        return array('h', (max(-32768, min(32767, sample + int(self.echo_gain * echo[i % len(echo)]))) for i, sample in enumerate(mic))).tobytes()
+
+    def get_format_from_width(self, width):
+        return WIDTH_FORMATS[width]
+
+    def get_sample_size(self, audio_format):
+        return FORMAT_WIDTHS.get(audio_format, 2)
+
+    def get_default_input_device_info(self):
+        return {'name': "Null input", 'maxInputChannels': 1}
+
+    def open(self, format, channels, rate, input=False, output=False, frames_per_buffer=1024, stream_callback=None, **kwargs):
+        stream = NullAudioStream(self, self.get_sample_size(format), channels, rate, input, frames_per_buffer, stream_callback)
+        self.open_streams.add(stream)
+        return stream
+
+    def terminate(self):
+        for stream in list(self.open_streams):
+            stream.close()
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self, settings=None):
+        self.settings = merge_settings(DEFAULT_FAKE_SETTINGS, settings)
+        self.rng = random.Random(self.settings['seed'])
+        self.live_caches = set()
+        self.generate_calls = 0
+        self.synthesize_calls = 0
+        self.cache_creations = 0
+        self.tts_download_bytes = 0
+        self.stt_upload_bytes = 0
+        self.llm_connection = FakeConnection(self, "llm")
+
+    def preload(self):
+        pass
+
+    def connect(self):
+        return FakeTTSClient(self), FakeSpeechClient(self)
+
+    def generative_model(self, model_name, system_instruction):
+        return FakeGenerativeModel(self, model_name)
+
+    def model_from_cache(self, cache):
+        return FakeGenerativeModel(self, cache.model_name, cache)
+
+    def create_cache(self, model_name, system_instruction, contents, ttl):
+        latency = FakeLatency(self.rng, self.settings['llm']['jitter_ms'], self.settings['llm']['failure_rate'], "CachedContent.create")
+        time.sleep(latency.seconds(self.settings['llm']['cache_create_ms']))
+        latency.maybe_fail()
+        cache = FakeCachedContent(self, model_name, [{'parts': [{'text': system_instruction}]}] + list(contents), ttl)
+        self.live_caches.add(cache)
+        self.cache_creations += 1
+        return cache
+
+    def audio_interface(self):
+        return NullAudioInterface(**self.settings['audio'])
+
+    async def warm_tts(self, client):
+        await client.list_voices(language_code="en-US")
+
+    async def warm_stt(self, client):
+        await client.connection.use()
+
+    async def warm_llm(self, model):
+        await model.count_tokens_async("ping")
+
+    def connection_counts(self, clients):
+        return {'llm': self.llm_connection.connects, 'tts': clients[0].connection.connects, 'stt': clients[1].connection.connects}
+
+    def compose_reply(self, target_chars):
+        parts, length = [], 0
+        while length < target_chars:
+            sentence = self.rng.choice(REPLY_SENTENCES)
+            parts.append(sentence)
+            length += len(sentence) + 1
+        return "<speak>" + " ".join(parts) + "</speak>"
@@ -2,6 +2,23 @@
 import tkinter as tk
 from tkinter import scrolledtext, font
 import queue
+import threading
+from collections import deque
+
+COALESCED_MESSAGES = ("update_entry", "ui_state")
+
+class UIUpdateQueue(queue.Queue):
+    def __init__(self):
+        super().__init__()
+        self.waker = None
+
+    def set_waker(self, waker):
+        self.waker = waker
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        if self.waker:
+            self.waker()
 
 class DianeGUI:
     def __init__(self, root, backend_queue, ui_queue):
@@ -10,6 +27,20 @@ class DianeGUI:
         self.ui_queue = ui_queue
         
         self.current_app_state = "idle"
+        self.live_entry_text = ""
+        self.widget_options = {}
+        self.last_ui_config = None
+        self.drain_lock = threading.Lock()
+        self.drain_scheduled = False
+        self.drain_retry_seconds = 0.05
+        self.closed = False
+        self.history_max_turns = 200
+        self.history_page_turns = 40
+        self.history_entries = deque()
+        self.history_mark_counter = 0
+        self.history_detached = False
+        self.history_page_pending = False
+        self.pending_live_entries = deque()
 
         self.root.title("Diane AI")
         
@@ -38,6 +69,7 @@ class DianeGUI:
         self.history_text.tag_configure("bold", font=self.mono_font_bold)
         
         self.history_text.config(state='disabled')
+        self.history_text.config(yscrollcommand=self._on_history_scroll)
         
         # --- Bottom Frame Content ---
         entry_frame = tk.Frame(bottom_frame, bg="#d0d0d0")
@@ -84,7 +116,11 @@ class DianeGUI:
         self.activation_buttons = self.all_buttons[:6]
 
         self.disable_entry_box()
-        self.root.after(100, self.process_queue)
+        self.root.bind("<<DrainUIQueue>>", self.process_queue)
+        self.root.bind("<Destroy>", self._on_destroy, add="+")
+        if hasattr(self.ui_queue, 'set_waker'):
+            self.ui_queue.set_waker(self.request_drain)
+        self.root.after_idle(self.process_queue)
 
     def _adjust_text_height(self, event=None):
         min_height = 1
@@ -113,77 +149,244 @@ class DianeGUI:
             if user_input:
                 self.send_to_backend('send_request', user_input)
 
-    def process_queue(self):
+    def request_drain(self):
+        with self.drain_lock:
+            if self.drain_scheduled or self.closed:
+                return
+            self.drain_scheduled = True
+        try:
+            self.root.event_generate("<<DrainUIQueue>>", when="tail")
+        except (RuntimeError, tk.TclError):
+            with self.drain_lock:
+                self.drain_scheduled = False
+            retry = threading.Timer(self.drain_retry_seconds, self.request_drain)
+            retry.daemon = True
+            retry.start()
+
+    def _on_destroy(self, event):
+        if event.widget is self.root:
+            self.closed = True
+
+    def process_queue(self, event=None):
+        with self.drain_lock:
+            self.drain_scheduled = False
+        messages = []
         try:
             while True:
-                message_type, content = self.ui_queue.get_nowait()
-                if message_type == "history": self.add_to_history(content)
-                elif message_type == "status": self.update_status(content)
-                elif message_type == "ui_state": self.update_ui_state(content)
-                elif message_type == "request_gui_input": self.send_input()
-                elif message_type == "update_entry":
-                    self.update_live_entry(content)
+                messages.append(self.ui_queue.get_nowait())
         except queue.Empty:
+            pass
+        latest = {message_type: i for i, (message_type, _) in enumerate(messages) if message_type in COALESCED_MESSAGES}
+        for i, (message_type, content) in enumerate(messages):
+            if message_type in COALESCED_MESSAGES and latest[message_type] != i: continue
+            if message_type == "history": self.add_to_history(content)
+            elif message_type == "history_index": self.assign_history_index(content)
+            elif message_type == "history_page": self.apply_history_page(content)
+            elif message_type == "history_settings": self.apply_history_settings(content)
+            elif message_type == "status": self.update_status(content)
+            elif message_type == "ui_state": self.update_ui_state(content)
+            elif message_type == "request_gui_input": self.send_input()
+            elif message_type == "update_entry":
+                self.update_live_entry(content)
+        if not hasattr(self.ui_queue, 'set_waker'):
             self.root.after(100, self.process_queue)
 
-    def add_to_history(self, text):
+    def apply_history_settings(self, settings):
+        self.history_max_turns = max(1, settings.get('max_turns', self.history_max_turns))
+        self.history_page_turns = max(1, settings.get('page_turns', self.history_page_turns))
+        self._trim_history(from_top=True)
+
+    def add_to_history(self, content):
+        text, index = content if isinstance(content, tuple) else (content, None)
+        if self.history_detached:
+            self.pending_live_entries.append([text, index])
+            while len(self.pending_live_entries) > self.history_max_turns:
+                self.pending_live_entries.popleft()
+            self._request_history_page(None)
+            return
+        self._insert_history_entry(text, index, at_top=False)
+        self._trim_history(from_top=True)
+        self.history_text.see(tk.END)
+
+    def assign_history_index(self, index):
+        entries = self.pending_live_entries if self.history_detached else self.history_entries
+        for entry in reversed(entries):
+            if entry[-1] is None:
+                entry[-1] = index
+                return
+
+    def apply_history_page(self, page):
+        self.history_page_pending = False
+        lines, start, end = page['lines'], page['start'], page['end']
+        if page['direction'] == 'latest':
+            self._clear_history()
+            for offset, line in enumerate(lines):
+                self._insert_history_entry(line, start + offset, at_top=False)
+            for text, index in self.pending_live_entries:
+                if index is None or index >= end:
+                    self._insert_history_entry(text, index, at_top=False)
+            self.pending_live_entries.clear()
+            self.history_detached = False
+            self._trim_history(from_top=True)
+            self.history_text.see(tk.END)
+        elif page['direction'] == 'older':
+            if end != self._oldest_history_index():
+                return
+            anchor = self.history_entries[0][0] if self.history_entries else None
+            for offset, line in reversed(list(enumerate(lines))):
+                self._insert_history_entry(line, start + offset, at_top=True)
+            if self._trim_history(from_top=False):
+                self.history_detached = True
+            if anchor:
+                self.history_text.yview(anchor)
+        elif page['direction'] == 'newer':
+            if start != self._newest_history_index() + 1:
+                return
+            anchor = self.history_entries[-1][0] if self.history_entries else None
+            for offset, line in enumerate(lines):
+                self._insert_history_entry(line, start + offset, at_top=False)
+            self._trim_history(from_top=True)
+            if page['at_end']:
+                self.history_detached = False
+                for text, index in self.pending_live_entries:
+                    if index is None or index >= end:
+                        self._insert_history_entry(text, index, at_top=False)
+                self.pending_live_entries.clear()
+                self._trim_history(from_top=True)
+            if anchor:
+                self.history_text.see(anchor)
+
+    def _on_history_scroll(self, first, last):
+        self.history_text.vbar.set(first, last)
+        if self.history_page_pending or not self.history_entries:
+            return
+        if float(first) <= 0.0:
+            oldest = self._oldest_history_index()
+            if oldest:
+                self._request_history_page('older', before=oldest)
+        elif float(last) >= 1.0 and self.history_detached:
+            self._request_history_page('newer', after=self._newest_history_index() + 1)
+
+    def _request_history_page(self, direction, **bounds):
+        if self.history_page_pending:
+            return
+        self.history_page_pending = True
+        self.send_to_backend('load_history_page', dict(bounds, direction=direction or 'latest', count=self.history_page_turns))
+
+    def _oldest_history_index(self):
+        return next((entry[1] for entry in self.history_entries if entry[1] is not None), None)
+
+    def _newest_history_index(self):
+        return next((entry[1] for entry in reversed(self.history_entries) if entry[1] is not None), -1)
+
+    def _insert_history_entry(self, text, index, at_top):
         self.history_text.config(state='normal')
-        
+        position = "1.0" if at_top else self.history_text.index("end-1c")
         try:
             prefix, message = text.split(":", 1)
-            prefix += ":"
-            message = message.lstrip()
-            
-            self.history_text.insert(tk.END, prefix, "bold")
-            self.history_text.insert(tk.END, " " + message + "\n\n")
-
+            segments = [(prefix + ":", ("bold",)), (" " + message.lstrip() + "\n\n", ())]
         except ValueError:
-            self.history_text.insert(tk.END, text + "\n\n")
+            segments = [(text + "\n\n", ())]
+        for segment, tags in reversed(segments):
+            self.history_text.insert(position, segment, tags)
+        self.history_text.config(state='disabled')
+        self.history_mark_counter += 1
+        mark = f"entry{self.history_mark_counter}"
+        self.history_text.mark_set(mark, position)
+        self.history_text.mark_gravity(mark, tk.RIGHT)
+        entry = [mark, index]
+        if at_top:
+            self.history_entries.appendleft(entry)
+        else:
+            self.history_entries.append(entry)
 
+    def _trim_history(self, from_top):
+        trimmed = False
+        self.history_text.config(state='normal')
+        while len(self.history_entries) > self.history_max_turns:
+            if from_top:
+                mark, _ = self.history_entries.popleft()
+                self.history_text.delete("1.0", self.history_entries[0][0])
+            else:
+                mark, _ = self.history_entries.pop()
+                self.history_text.delete(mark, "end-1c")
+            self.history_text.mark_unset(mark)
+            trimmed = True
         self.history_text.config(state='disabled')
-        self.history_text.see(tk.END)
+        return trimmed
+
+    def _clear_history(self):
+        self.history_text.config(state='normal')
+        self.history_text.delete("1.0", tk.END)
+        for mark, _ in self.history_entries:
+            self.history_text.mark_unset(mark)
+        self.history_text.config(state='disabled')
+        self.history_entries.clear()
 
     def update_status(self, text): self.status_bar.config(text=text)
 
     def update_live_entry(self, text):
-        if self.current_app_state != "listening":
+        if self.current_app_state != "listening" or text == self.live_entry_text:
             return
-            
+
+        common = 0
+        limit = min(len(text), len(self.live_entry_text))
+        while common < limit and text[common] == self.live_entry_text[common]:
+            common += 1
+        shrank = len(text) < len(self.live_entry_text)
+
         self.live_text_entry.config(state='normal')
-        self.live_text_entry.delete("1.0", tk.END)
-        self.live_text_entry.insert("1.0", text)
+        if common < len(self.live_entry_text):
+            self.live_text_entry.delete(f"1.0 + {common} chars", tk.END)
+        self.live_text_entry.insert(tk.END, text[common:])
         self.live_text_entry.config(state='disabled')
         self.live_text_entry.see(tk.END)
-        self._adjust_text_height()
+        self.live_entry_text = text
+        if shrank or int(self.live_text_entry.cget("height")) < 5:
+            self._adjust_text_height()
 
     def enable_text_mode(self):
         self.entry_label.config(text="Input:")
         self.live_text_entry.config(state='normal', fg="#1a1a1a")
         self.live_text_entry.delete("1.0", tk.END)
+        self.live_entry_text = ""
         self._adjust_text_height()
         self.live_text_entry.focus_set()
 
     def disable_entry_box(self):
         self.live_text_entry.config(state='normal')
         self.live_text_entry.delete("1.0", tk.END)
+        self.live_entry_text = ""
         self.live_text_entry.config(state='disabled', fg="#555555")
         self._adjust_text_height()
         self.entry_label.config(text="Input:")
         
+    def _configure(self, widget, **options):
+        current = self.widget_options.setdefault(widget, {})
+        changed = {key: value for key, value in options.items() if current.get(key) != value}
+        if changed:
+            widget.config(**changed)
+            current.update(changed)
+
     def update_ui_state(self, state_config):
+        if state_config == self.last_ui_config:
+            return
+        self.last_ui_config = state_config
+        previous_app_state = self.current_app_state
         self.current_app_state = state_config.get('app_state', 'idle')
 
         if self.current_app_state == 'listening':
             self.live_text_entry.config(state='disabled', fg="#1a1a1a")
         elif state_config.get('entry_box_enabled', False):
-            self.enable_text_mode()
+            if previous_app_state != self.current_app_state:
+                self.enable_text_mode()
         else:
             self.disable_entry_box()
 
-        for btn in self.activation_buttons: btn.config(state=state_config.get('activations', 'disabled'))
-        self.btn_send.config(state=state_config.get('send', 'disabled'))
-        self.btn_cancel.config(state=state_config.get('cancel', 'disabled'))
-        self.btn_pause_resume.config(state=state_config.get('pause_resume', 'disabled'))
+        for btn in self.activation_buttons: self._configure(btn, state=state_config.get('activations', 'disabled'))
+        self._configure(self.btn_send, state=state_config.get('send', 'disabled'))
+        self._configure(self.btn_cancel, state=state_config.get('cancel', 'disabled'))
+        self._configure(self.btn_pause_resume, state=state_config.get('pause_resume', 'disabled'))
         
-        self.btn_send.config(text=state_config.get('send_text', 'Send'), command=self.send_input if state_config.get('send_command') == 'send' else self.stop_listening)
-        self.btn_pause_resume.config(text=state_config.get('pause_resume_text', 'Pause/Resume'))
+        self._configure(self.btn_send, text=state_config.get('send_text', 'Send'), command=self.send_input if state_config.get('send_command') == 'send' else self.stop_listening)
+        self._configure(self.btn_pause_resume, text=state_config.get('pause_resume_text', 'Pause/Resume'))
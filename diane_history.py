@@ -0,0 +1,153 @@
+# diane_history.py
+import threading
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+CALIBRATION_WEIGHT = 0.2
+
+def turn_text(turn):
+    return ''.join(str(part.get('text', '')) for part in turn.get('parts', []))
+
+class TokenLedger:
+    def __init__(self, default_chars_per_token=DEFAULT_CHARS_PER_TOKEN, calibration_weight=CALIBRATION_WEIGHT):
+        self.default_chars_per_token = default_chars_per_token
+        self.calibration_weight = calibration_weight
+        self.chars_per_token = {}
+        self.turn_tokens = []
+        self.exact_turns = []
+        self.prefix_sums = [0]
+
+    def __len__(self):
+        return len(self.turn_tokens)
+
+    def ratio_for(self, model_key):
+        return self.chars_per_token.get(model_key, self.default_chars_per_token)
+
+    def estimate(self, text, model_key=None):
+        return len(text) / self.ratio_for(model_key)
+
+    def append(self, turn, model_key=None, exact_tokens=None):
+        tokens = exact_tokens if exact_tokens is not None else self.estimate(turn_text(turn), model_key)
+        self.turn_tokens.append(tokens)
+        self.exact_turns.append(exact_tokens is not None)
+        self.prefix_sums.append(self.prefix_sums[-1] + tokens)
+        return tokens
+
+    def total(self):
+        return self.prefix_sums[-1]
+
+    def range_tokens(self, start, end=None):
+        end = len(self.turn_tokens) if end is None else end
+        start = max(0, min(start, end))
+        return self.prefix_sums[end] - self.prefix_sums[start]
+
+    def fold(self, count, summary_tokens):
+        self.turn_tokens = [summary_tokens] + self.turn_tokens[count:]
+        self.exact_turns = [False] + self.exact_turns[count:]
+        prefix_sums = [0]
+        for tokens in self.turn_tokens:
+            prefix_sums.append(prefix_sums[-1] + tokens)
+        self.prefix_sums = prefix_sums
+
+    def calibrate(self, model_key, text_chars, observed_tokens):
+        if not text_chars or not observed_tokens:
+            return
+        observed_ratio = text_chars / observed_tokens
+        current = self.ratio_for(model_key)
+        self.chars_per_token[model_key] = current + self.calibration_weight * (observed_ratio - current)
+
+def make_turn(role, text):
+    return {'role': role, 'parts': [{'text': text}]}
+
+class HistorySnapshot:
+    __slots__ = ('_turns', '_prefix_sums', 'length', 'version', 'folded')
+
+    def __init__(self, turns, prefix_sums, length, version, folded=0):
+        self._turns = turns
+        self._prefix_sums = prefix_sums
+        self.length = length
+        self.version = version
+        self.folded = folded
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self._turns[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._turns[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("history snapshot index out of range")
+        return self._turns[index]
+
+    def turns(self, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        return [turn if isinstance(turn, dict) else turn.materialize() for turn in self._turns[start:end]]
+
+    def total_tokens(self):
+        return self._prefix_sums[self.length]
+
+    def range_tokens(self, start, end=None):
+        end = self.length if end is None else min(end, self.length)
+        start = max(0, min(start, end))
+        return self._prefix_sums[end] - self._prefix_sums[start]
+
+    def last_role(self):
+        return self._turns[self.length - 1]['role'] if self.length else None
+
+    def raw_length(self, length=None):
+        length = self.length if length is None else length
+        return length + self.folded - 1 if self.folded and length else length
+
+    def live_length(self, raw_length):
+        if not self.folded:
+            return raw_length
+        if raw_length < self.folded:
+            return None
+        return raw_length - self.folded + 1
+
+class ConversationHistory:
+    def __init__(self, ledger=None):
+        self.lock = threading.Lock()
+        self.ledger = ledger or TokenLedger()
+        self._turns = []
+        self.version = 0
+        self.folded = 0
+
+    def __len__(self):
+        return len(self._turns)
+
+    def snapshot(self):
+        with self.lock:
+            return HistorySnapshot(self._turns, self.ledger.prefix_sums, len(self._turns), self.version, self.folded)
+
+    def append(self, *entries):
+        with self.lock:
+            turn_tokens = []
+            for turn, model_key, exact_tokens in entries:
+                turn_tokens.append(self.ledger.append(turn, model_key, exact_tokens))
+                self._turns.append(turn)
+            self.version += 1
+            return self.version, turn_tokens
+
+    def fold(self, snapshot, end, summary_turn):
+        with self.lock:
+            if self.folded != snapshot.folded or end > len(self._turns):
+                return None
+            self.folded = snapshot.raw_length(end)
+            self._turns = [summary_turn] + self._turns[end:]
+            self.ledger.fold(end, self.ledger.estimate(turn_text(summary_turn)))
+            self.version += 1
+            return self.version
+
+    def calibrate(self, model_key, text_chars, observed_tokens):
+        with self.lock:
+            self.ledger.calibrate(model_key, text_chars, observed_tokens)
+
+    def estimate(self, text, model_key=None):
+        with self.lock:
+            return self.ledger.estimate(text, model_key)
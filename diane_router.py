@@ -0,0 +1,129 @@
+# diane_router.py
+import time
+import asyncio
+from collections import deque
+from diane_speculation import Speculation
+
+DEFAULT_ROUTER_SETTINGS = {
+    'enabled': False,
+    'budget_ms': 2500,
+    'fallbacks': {'pro': 'flash', 'flash': 'lite'},
+    'hedge_quantile': 0.9,
+    'initial_hedge_ms': 1500,
+    'min_hedge_ms': 250,
+    'min_samples': 5,
+    'window': 50,
+}
+
+class HedgedRouter:
+    def __init__(self, settings, models):
+        self.settings = dict(DEFAULT_ROUTER_SETTINGS, **(settings or {}))
+        self.enabled = self.settings['enabled']
+        self.fallbacks = {key: fallback for key, fallback in self.settings['fallbacks'].items() if key in models and fallback in models and fallback != key}
+        self.latencies = {key: deque(maxlen=self.settings['window']) for key in models}
+        self.counts = {'routed': 0, 'hedged': 0, 'primary_wins': 0, 'hedge_wins': 0, 'over_budget': 0, 'failed': 0}
+
+    def observe(self, model_key, first_byte_ms):
+        if model_key in self.latencies:
+            self.latencies[model_key].append(first_byte_ms)
+
+    def quantile(self, model_key, q):
+        samples = sorted(self.latencies.get(model_key, ()))
+        if len(samples) < self.settings['min_samples']:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self, model_key):
+        fallback = self.fallbacks.get(model_key)
+        if fallback is None:
+            return None
+        budget = self.settings['budget_ms']
+        delay = self.quantile(model_key, self.settings['hedge_quantile'])
+        if delay is None:
+            delay = self.settings['initial_hedge_ms']
+        rescue = self.quantile(fallback, 0.5)
+        if rescue is not None:
+            delay = min(delay, budget - rescue)
+        return max(self.settings['min_hedge_ms'], min(delay, budget)) / 1000
+
+    async def race(self, text, model_key, generate):
+        self.counts['routed'] += 1
+        attempts = [self._launch(text, model_key, generate)]
+        try:
+            delay = self.hedge_delay(model_key)
+            if delay is not None:
+                await self._settle(attempts, delay)
+                if not self._answered(attempts[0]):
+                    fallback = self.fallbacks[model_key]
+                    self.counts['hedged'] += 1
+                    print(f"--- HEDGE: '{model_key.upper()}' has not answered after {delay * 1000:.0f} ms. Also asking '{fallback.upper()}'. ---")
+                    attempts.append(self._launch(text, fallback, generate))
+            winner = await self._first_answer(attempts)
+        except asyncio.CancelledError:
+            for attempt in attempts:
+                attempt.task.cancel()
+            raise
+        for attempt in attempts:
+            if attempt is not winner:
+                self._retire(attempt)
+        if winner is None:
+            self.counts['failed'] += 1
+            return None
+        self.counts['primary_wins' if winner is attempts[0] else 'hedge_wins'] += 1
+        if winner.first_byte_at is not None:
+            first_byte_ms = (winner.first_byte_at - attempts[0].started_at) * 1000
+            self.observe(winner.model_key, (winner.first_byte_at - winner.started_at) * 1000)
+            if first_byte_ms > self.settings['budget_ms']:
+                self.counts['over_budget'] += 1
+        return winner
+
+    def _launch(self, text, model_key, generate):
+        attempt = Speculation(text, model_key)
+        attempt.task = asyncio.create_task(self._run(attempt, generate))
+        return attempt
+
+    async def _run(self, attempt, generate):
+        try:
+            await generate(attempt)
+            attempt.finish()
+        except asyncio.CancelledError:
+            attempt.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            attempt.finish(e)
+
+    @staticmethod
+    def _answered(attempt):
+        return bool(attempt.parts) or (attempt.done and attempt.error is None)
+
+    async def _settle(self, attempts, timeout=None):
+        waiters = [asyncio.ensure_future(attempt.changed.wait()) for attempt in attempts]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def _first_answer(self, attempts):
+        while True:
+            answered = [attempt for attempt in attempts if self._answered(attempt)]
+            if answered:
+                return min(answered, key=lambda attempt: attempt.first_byte_at or time.perf_counter())
+            running = [attempt for attempt in attempts if not attempt.done]
+            if not running:
+                return None
+            await self._settle(running)
+
+    def _retire(self, attempt):
+        if not attempt.done:
+            attempt.task.cancel()
+            self.observe(attempt.model_key, (time.perf_counter() - attempt.started_at) * 1000)
+        elif attempt.first_byte_at is not None:
+            self.observe(attempt.model_key, (attempt.first_byte_at - attempt.started_at) * 1000)
+
+    def stats(self):
+        latency = {key: {'p50_ms': self.quantile(key, 0.5), 'p90_ms': self.quantile(key, 0.9), 'samples': len(samples)} for key, samples in self.latencies.items() if samples}
+        return dict(self.counts, latency=latency)
+
+    def summary(self):
+        return f"Router: {self.counts['hedged']}/{self.counts['routed']} turns hedged, {self.counts['hedge_wins']} won by the fallback, {self.counts['over_budget']} over the {self.settings['budget_ms']} ms budget."
@@ -1,87 +1,63 @@
-import os, sys, json, re, tempfile, threading, time, wave, html
-from html.parser import HTMLParser
-import google.generativeai as genai
-from google.cloud import texttospeech, speech
-import pyaudio
-import keyboard
+import os, sys, json, threading, time, struct, asyncio
+STARTED_AT = time.perf_counter()
 from dotenv import load_dotenv
-from queue import Queue, Empty
+from collections import deque
 from threading import Lock
-from diane_gui import DianeGUI
-import xml.etree.ElementTree as ET
+from diane_gui import DianeGUI, UIUpdateQueue
+from diane_tts_cache import TTSAudioCache
+from diane_history import ConversationHistory, make_turn
+from diane_context_cache import ContextCacheManager
+from diane_session_store import SessionStore
+from diane_tracing import LatencyTracer
+from diane_backends import create_backend
+from diane_vad import VoiceActivityDetector, chunk_level_dbfs
+from diane_bargein import BargeInMonitor
+from diane_deadlines import DEFAULT_DEADLINES, wait_stage, stream_with_deadlines
+from diane_connections import ConnectionManager
+from diane_codecs import StreamingEncoder, STT_ENCODINGS, TTS_ENCODINGS, FILE_EXTENSIONS, resolve_encoding, decode_audio
+from diane_ssml import SSMLStreamSegmenter, parse_ssml, sanitize_ssml, split_ssml
+from diane_startup import LazyModule, StartupProfile
+from diane_speculation import SpeculativeDispatcher
+from diane_router import HedgedRouter
+from diane_summarizer import HistorySummarizer
 import tkinter as tk
 
+texttospeech = LazyModule('google.cloud.texttospeech')
+speech = LazyModule('google.cloud.speech')
+pyaudio = LazyModule('pyaudio')
+keyboard = LazyModule('keyboard')
+
 if sys.platform == "win32":
     import win32api, win32process, win32con
 
 app_state = "idle"
+greeting_active = False
 state_lock = Lock()
 staged_model_key = ""
 staged_input = ""
-cancellation_event = threading.Event()
-stop_listening_event = threading.Event()
-ACTIVE_VOICE_THREAD = None
-
-master_history = []
-history_lock = Lock()
-model_caches = {}
-cache_source_lens = {}
+stop_listening_event = None
+active_turn = None
+current_trace = None
+
+master_history = ConversationHistory()
 MINIMUM_CACHE_TOKENS = 2048
 CACHE_COMPACTION_THRESHOLD = 30
 DIFF_TOKEN_REBUILD_THRESHOLD = 4096
-
-class SSMLFixer(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.result = []
-        self.is_in_prosody = False
-
-    def handle_starttag(self, tag, attrs):
-        attr_str = ''.join([f' {k}="{v}"' for k, v in attrs])
-        if tag == 'prosody':
-            if self.is_in_prosody:
-                self.result.append('</prosody>')
-            self.result.append(f'<prosody{attr_str}>')
-            self.is_in_prosody = True
-        elif tag == 'break':
-            self.result.append(f'<break{attr_str}/>')
-        else:
-            self.result.append(f'<{tag}{attr_str}>')
-
-    def handle_endtag(self, tag):
-        if tag == 'prosody':
-            if self.is_in_prosody:
-                self.result.append('</prosody>')
-                self.is_in_prosody = False
-        elif tag == 'break':
-            pass
-        else:
-            self.result.append(f'</{tag}>')
-
-    def handle_data(self, data):
-        self.result.append(data)
-
-    def get_fixed_ssml(self):
-        if self.is_in_prosody:
-            self.result.append('</prosody>')
-        return "".join(self.result)
-
-def sanitize_ssml(raw_text):
-    cleaned_text = re.sub(r'```xml\s*|```', '', raw_text).strip()
-    cleaned_text = re.sub(r'(")([a-zA-Z]+=)', r'\1 \2', cleaned_text)
-    cleaned_text = cleaned_text.replace('</mods>', '</prosody>')
-    cleaned_text = cleaned_text.replace('</songs>', '</prosody>')
-    cleaned_text = re.sub(r'</?emphasis.*?>', '', cleaned_text)
-    cleaned_text = re.sub(r'&(?![a-zA-Z#0-9]+;)', '&', cleaned_text)
-    content = re.sub(r'</?speak>', '', cleaned_text).strip()
-    fixer = SSMLFixer()
-    fixer.feed(content)
-    fixed_content = fixer.get_fixed_ssml()
-    return f"<speak>{fixed_content}</speak>"
-
-def strip_ssml_tags(sanitized_ssml):
-    text_without_tags = re.sub(r'<[^>]+>', '', sanitized_ssml)
-    return html.unescape(text_without_tags).strip()
+SUMMARY_TRIGGER_TOKENS = 32768
+SUMMARY_KEEP_RECENT_TURNS = 20
+BRAIN_ERROR_SSML = "<speak>I seem to be having trouble connecting to my brain.</speak>"
+tts_cache = None
+tracer = None
+backend = None
+prewarm_task = None
+history_page_task = None
+connections = None
+speculator = None
+router = None
+summarizer = None
+barge_in_monitor = None
+pending_cancel = None
+deadlines = dict(DEFAULT_DEADLINES)
 
 def set_high_priority():
     try:
@@ -96,66 +72,198 @@ def set_high_priority():
     except Exception as e:
         print(f"⚠️  Could not set high process priority: {e}")
 
-def estimate_token_count(history):
-    count = 0
-    for turn in history:
-        for part in turn.get('parts', []):
-            count += len(str(part.get('text', '')))
-    return count / 4
+class AudioBuffer:
+    __slots__ = ('pcm', 'sample_width', 'channels', 'rate')
+
+    def __init__(self, pcm, sample_width, channels, rate):
+        self.pcm = pcm
+        self.sample_width = sample_width
+        self.channels = channels
+        self.rate = rate
+
+    @property
+    def format_key(self):
+        return (self.sample_width, self.channels, self.rate)
+
+def parse_wav_bytes(data):
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[0:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise ValueError("Audio content is not a RIFF/WAVE payload.")
+    offset, fmt = 12, None
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from('<I', view, offset + 4)[0]
+        body_start = offset + 8
+        if chunk_id == b'fmt ':
+            _, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', view, body_start)
+            fmt = (bits // 8, channels, rate)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAVE data chunk precedes its fmt chunk.")
+            body_end = min(body_start + chunk_size, len(view))
+            return AudioBuffer(view[body_start:body_end], *fmt)
+        offset = body_start + chunk_size + (chunk_size & 1)
+    raise ValueError("WAVE payload has no data chunk.")
+
+async def decode_tts_audio(audio_bytes, audio_settings):
+    encoding = audio_settings.get('tts_encoding', 'LINEAR16')
+    if encoding == 'LINEAR16':
+        return parse_wav_bytes(audio_bytes)
+    return AudioBuffer(*await asyncio.to_thread(decode_audio, audio_bytes))
+
+def dump_audio_for_debug(audio_bytes, dump_dir, extension="wav"):
+    try:
+        os.makedirs(dump_dir, exist_ok=True)
+        filepath = os.path.join(dump_dir, f"tts_{time.strftime('%Y%m%d_%H%M%S')}_{time.perf_counter_ns() % 1000000:06d}.{extension}")
+        with open(filepath, 'wb') as f:
+            f.write(audio_bytes)
+        print(f"💾 Dumped TTS audio to '{filepath}'")
+    except OSError as e:
+        print(f"⚠️  Could not dump TTS audio: {e}")
+
+class AudioPlayer:
+    def __init__(self, loop, pa, frames_per_buffer=256):
+        self.loop = loop
+        self.pa = pa
+        self.frames_per_buffer = frames_per_buffer
+        self.ring_lock = Lock()
+        self.pending = deque()
+        self.ring = deque()
+        self.ring_offset = 0
+        self.ring_bytes = 0
+        self.paused = False
+        self.playing = False
+        self.feed_settled = False
+        self.active_feeds = 0
+        self.stream = None
+        self.stream_format = None
+        self.stream_frame_size = 0
+        self.stream_rate = 0
+        self.first_audio_callback = None
+        self.level_listener = None
+        self.queued_seconds = 0.0
+        self.played_seconds = 0.0
+
+    def arm_first_audio(self, callback):
+        self.first_audio_callback = callback
+
+    def _pump(self):
+        if self.pending and self.pending[0].format_key != self.stream_format:
+            with self.ring_lock:
+                ring_busy = self.ring_bytes > 0
+            if ring_busy:
+                return
+            self._open_stream(self.pending[0].format_key)
+        started, finished = False, False
+        with self.ring_lock:
+            while self.pending and self.pending[0].format_key == self.stream_format:
+                pcm = self.pending.popleft().pcm
+                if len(pcm):
+                    self.ring.append(pcm)
+                    self.ring_bytes += len(pcm)
+            if self.ring_bytes and not self.playing:
+                self.playing = started = True
+            elif self._is_drained():
+                self.playing = self.feed_settled = False
+                self.queued_seconds = self.played_seconds = 0.0
+                finished = True
+        if started and app_state == "processing":
+            set_application_state("speaking")
+        elif finished and app_state in ["processing", "speaking", "paused"]:
+            set_application_state("idle")
 
-class AudioPlayer(threading.Thread):
-    def __init__(self):
-        super().__init__(daemon=True, name="AudioPlayer")
-        self.audio_queue = Queue()
-        self.pause_event = threading.Event()
-        self.pause_event.set()
-        self.stop_playback_event = threading.Event()
-        self.current_file = None
-    def run(self):
-        while True:
+    def _is_drained(self):
+        return self.ring_bytes == 0 and self.active_feeds == 0 and (self.playing or self.feed_settled)
+
+    def _open_stream(self, audio_format):
+        sample_width, channels, rate = audio_format
+        try:
+            if self.stream is not None:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.stream = None
+            print(f"--- Opening output stream ({rate} Hz, {channels} ch, {8 * sample_width}-bit) ---")
+            with self.ring_lock:
+                self.stream_format = audio_format
+                self.stream_frame_size = sample_width * channels
+                self.stream_rate = rate
+            self.stream = self.pa.open(format=self.pa.get_format_from_width(sample_width), channels=channels, rate=rate, output=True, frames_per_buffer=self.frames_per_buffer, stream_callback=self._fill_output)
+        except Exception as e:
+            print(f"❌ Audio player error: {e}")
+            self.stream_format = None
+            self.pending.clear()
+            self.feed_settled = True
+
+    def _fill_output(self, in_data, frame_count, time_info, status):
+        out = bytearray(frame_count * self.stream_frame_size)
+        drained, first_audio_callback, written = False, None, 0
+        with self.ring_lock:
+            if not self.paused:
+                while written < len(out) and self.ring:
+                    head = self.ring[0]
+                    take = min(len(out) - written, len(head) - self.ring_offset)
+                    out[written:written + take] = head[self.ring_offset:self.ring_offset + take]
+                    written += take
+                    self.ring_offset += take
+                    if self.ring_offset >= len(head):
+                        self.ring.popleft()
+                        self.ring_offset = 0
+                self.ring_bytes -= written
+                self.played_seconds += written / (self.stream_frame_size * self.stream_rate)
+                drained = written and self.ring_bytes == 0
+                first_audio_callback = self.first_audio_callback if written else None
+                if first_audio_callback:
+                    self.first_audio_callback = None
+        if first_audio_callback:
+            first_audio_callback(time.perf_counter())
+        level_listener = self.level_listener
+        if level_listener and written and self.stream_format[0] == 2:
+            level_listener(chunk_level_dbfs(out[:written]))
+        if drained:
             try:
-                self.current_file = self.audio_queue.get()
-                if self.current_file is None: continue
-                self.stop_playback_event.clear()
-                with wave.open(self.current_file, 'rb') as wf:
-                    p = pyaudio.PyAudio()
-                    stream = p.open(format=p.get_format_from_width(wf.getsampwidth()), channels=wf.getnchannels(), rate=wf.getframerate(), output=True)
-                    data = wf.readframes(1024)
-                    while data and not self.stop_playback_event.is_set():
-                        self.pause_event.wait()
-                        stream.write(data)
-                        data = wf.readframes(1024)
-                    stream.close()
-                    p.terminate()
-                if os.path.exists(self.current_file):
-                    os.remove(self.current_file)
-                self.current_file = None
-            except Exception as e:
-                print(f"❌ Audio player error: {e}")
-            if self.audio_queue.empty() and app_state in ["speaking", "paused"]:
-                set_application_state("idle")
-    def play_files(self, file_list):
-        for f in file_list:
-            self.audio_queue.put(f)
+                self.loop.call_soon_threadsafe(self._pump)
+            except RuntimeError:
+                pass
+        return bytes(out), pyaudio.paContinue
+
+    def play_buffers(self, buffer_list):
+        for audio_buffer in buffer_list:
+            self.queued_seconds += len(audio_buffer.pcm) / (audio_buffer.sample_width * audio_buffer.channels * audio_buffer.rate)
+        self.pending.extend(buffer_list)
+        self._pump()
+
+    def heard(self):
+        with self.ring_lock:
+            played, queued = self.played_seconds, self.queued_seconds
+        return {'heard_s': round(played, 2), 'queued_s': round(queued, 2), 'heard_fraction': round(played / queued, 3) if queued else 0.0}
+
+    def begin_feed(self):
+        self.active_feeds += 1
+
+    def end_feed(self, settle_state=True):
+        self.active_feeds = max(0, self.active_feeds - 1)
+        if settle_state:
+            self.feed_settled = True
+        self._pump()
+
     def toggle_pause(self):
         if app_state not in ["speaking", "paused"]:
             return
-        if self.pause_event.is_set():
-            self.pause_event.clear()
-            set_application_state("paused")
-        else:
-            self.pause_event.set()
-            set_application_state("speaking")
+        with self.ring_lock:
+            self.paused = not self.paused
+            paused = self.paused
+        set_application_state("paused" if paused else "speaking")
+
     def stop_and_clear(self):
-        self.stop_playback_event.set()
-        self.pause_event.set()
-        while not self.audio_queue.empty():
-            try:
-                filepath = self.audio_queue.get_nowait()
-                if filepath and os.path.exists(filepath):
-                    os.remove(filepath)
-            except (Empty, OSError):
-                pass
+        self.pending.clear()
+        with self.ring_lock:
+            self.ring.clear()
+            self.ring_offset = 0
+            self.ring_bytes = 0
+            self.paused = False
+            self.queued_seconds = self.played_seconds = 0.0
+        self.playing = False
+        self.feed_settled = False
 
 def load_configuration():
     print("--- Loading Configuration ---")
@@ -164,28 +272,78 @@ def load_configuration():
             config = json.load(f)
         with open(config['system_instruction_file'], 'r', encoding='utf-8') as f:
             config['system_instruction'] = f.read().strip()
-        audio_format_val = config['audio_settings']['pyaudio_format_constant']
-        if isinstance(audio_format_val, str):
-            config['audio_settings']['audio_format_pyaudio'] = getattr(pyaudio, audio_format_val, pyaudio.paInt16)
-        else:
-            config['audio_settings']['audio_format_pyaudio'] = audio_format_val
         print("✅ Configuration loaded successfully.")
         return config
     except Exception as e:
         print(f"❌ FATAL CONFIGURATION ERROR: {e}")
         return None
 
-def setup_clients():
-    print("--- Initializing API Clients ---")
+def resolve_transport_encodings(audio_settings):
+    audio_settings['stt_encoding'] = resolve_encoding(audio_settings.get('stt_encoding'), STT_ENCODINGS, "STT")
+    audio_settings['tts_encoding'] = resolve_encoding(audio_settings.get('tts_encoding'), TTS_ENCODINGS, "TTS")
+    if audio_settings['stt_encoding'] != 'LINEAR16' and audio_settings.get('audio_format_pyaudio', pyaudio.paInt16) != pyaudio.paInt16:
+        print("⚠️  Compressed STT upload needs paInt16 capture. Falling back to LINEAR16.")
+        audio_settings['stt_encoding'] = 'LINEAR16'
+
+def prepare_audio_device(active_backend, audio_settings):
+    try:
+        audio_format_val = audio_settings['pyaudio_format_constant']
+        if isinstance(audio_format_val, str):
+            audio_settings['audio_format_pyaudio'] = getattr(pyaudio, audio_format_val, pyaudio.paInt16)
+        else:
+            audio_settings['audio_format_pyaudio'] = audio_format_val
+        resolve_transport_encodings(audio_settings)
+        pa = active_backend.audio_interface()
+    except Exception as e:
+        print(f"❌ FATAL AUDIO DEVICE ERROR: {e}")
+        return None
+    try:
+        print(f"✅ Audio input device: {pa.get_default_input_device_info()['name']}")
+    except Exception as e:
+        print(f"⚠️  No default audio input device: {e}")
+    return pa
+
+def setup_clients(active_backend):
+    print(f"--- Initializing API Clients ({active_backend.name}) ---")
+    try:
+        return active_backend.connect()
+    except Exception as e:
+        print(f"❌ FATAL CLIENT SETUP ERROR: {e}")
+        return None, None
+
+async def connect_clients(active_backend):
     try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        return texttospeech.TextToSpeechClient(), speech.SpeechClient()
+        await asyncio.to_thread(active_backend.preload)
     except Exception as e:
         print(f"❌ FATAL CLIENT SETUP ERROR: {e}")
         return None, None
+    return setup_clients(active_backend)
+
+def register_hotkeys(backend_queue):
+    def on_send_hotkey():
+        if app_state == 'listening':
+            backend_queue.put(('stop_listening', None))
+        elif app_state == 'awaiting_text':
+            ui_queue.put(('request_gui_input', None))
+
+    try:
+        keyboard.add_hotkey('ctrl+shift+m', on_send_hotkey)
+        keyboard.add_hotkey('ctrl+alt+m', on_send_hotkey)
+        keyboard.add_hotkey('ctrl+shift+k', lambda: backend_queue.put(('cancel_action', None)))
+        keyboard.add_hotkey('ctrl+alt+k', lambda: backend_queue.put(('cancel_action', None)))
+        keyboard.add_hotkey('ctrl+shift+i', lambda: backend_queue.put(('toggle_pause_audio', None)))
+        keyboard.add_hotkey('ctrl+alt+i', lambda: backend_queue.put(('toggle_pause_audio', None)))
+        for model, key in [('l', 'lite'), ('o', 'flash'), ('p', 'pro')]:
+            keyboard.add_hotkey(f'ctrl+alt+{model}', lambda k=key: backend_queue.put(('start_voice', k)))
+            keyboard.add_hotkey(f'ctrl+shift+{model}', lambda k=key: backend_queue.put(('start_text', k)))
+    except Exception as e:
+        print(f"⚠️  Could not register global hotkeys: {e}")
+        return False
+    print("--- Hotkey listener is active ---")
+    return True
 
 def set_application_state(new_state, status_message=None):
-    global app_state
+    global app_state, greeting_active
     with state_lock:
         if app_state == new_state:
             return
@@ -194,8 +352,12 @@ def set_application_state(new_state, status_message=None):
         ui_config = {'activations': 'disabled', 'send': 'disabled', 'cancel': 'disabled', 'pause_resume': 'disabled', 'entry_box_enabled': False, 'pause_resume_text': 'Pause/Resume', 'send_text': 'Send', 'send_command': 'send'}
         ui_config['app_state'] = app_state
         if app_state == "idle":
+            greeting_active = False
             ui_config.update({'activations': 'normal', 'cancel': 'disabled'})
             status_message = status_message or "✅ Ready. Choose an input method."
+            readout = finish_turn_trace()
+            if readout:
+                status_message = f"{status_message}  {readout}"
         elif app_state == "listening":
             ui_config.update({'cancel': 'normal', 'send': 'normal', 'send_text': 'Send', 'send_command': 'stop'})
         elif app_state == "awaiting_text":
@@ -206,420 +368,906 @@ def set_application_state(new_state, status_message=None):
             ui_config.update({'cancel': 'normal', 'pause_resume': 'normal', 'pause_resume_text': 'Pause'})
         elif app_state == "paused":
             ui_config.update({'cancel': 'normal', 'pause_resume': 'normal', 'pause_resume_text': 'Resume'})
+        if greeting_active:
+            ui_config['activations'] = 'normal'
         ui_queue.put(("ui_state", ui_config))
         if status_message:
             ui_queue.put(("status", status_message))
+        update_barge_in_monitor()
+
+def update_barge_in_monitor():
+    global barge_in_monitor
+    if app_state == "speaking" and barge_in_monitor is None and config.get('barge_in', {}).get('enabled', False):
+        barge_in_monitor = BargeInMonitor(audio_player.pa, config['audio_settings'], config['barge_in'], audio_player.loop, handle_barge_in)
+        audio_player.level_listener = barge_in_monitor.detector.note_output
+        barge_in_monitor.start()
+    elif app_state not in ["speaking", "paused"] and barge_in_monitor is not None:
+        audio_player.level_listener = None
+        monitor, barge_in_monitor = barge_in_monitor, None
+        monitor.stop()
+
+def handle_barge_in(monitor):
+    global barge_in_monitor
+    if monitor is not barge_in_monitor or app_state not in ["speaking", "paused"]:
+        return
+    barge_in_monitor = None
+    audio_player.level_listener = None
+    heard = audio_player.heard()
+    heard['reply_complete'] = active_turn is None or active_turn.done()
+    print(f"--- BARGE-IN: User spoke after {heard['heard_s']:.1f} s of {heard['queued_s']:.1f} s queued reply audio ({heard['heard_fraction']:.0%} heard). ---")
+    if current_trace:
+        current_trace.set(barge_in=dict(heard, detector=monitor.detector.stats()))
+    interrupt_playback()
+    model_key = staged_model_key or connections.last_model_key
+    set_application_state("idle", f"🎙️ Barge-in after {heard['heard_fraction']:.0%} of the reply.")
+    if config['barge_in'].get('resume_listening', True):
+        handle_start_voice(model_key, monitor.triggered_at, source=monitor)
+    if app_state != "listening":
+        monitor.stop()
+
+def begin_turn_trace(kind, model_key, received_at=None):
+    global current_trace
+    trace = current_trace = tracer.begin_turn(kind, model_key, received_at)
+    audio_player.arm_first_audio(lambda at: trace.mark('first_audio', at))
+    return trace
+
+def finish_turn_trace():
+    global current_trace
+    trace, current_trace = current_trace, None
+    if trace is None:
+        return ""
+    audio_player.arm_first_audio(None)
+    status = 'cancelled' if trace.attrs.get('cancelled') else ('ok' if 'first_audio' in trace.marks else 'no_audio')
+    record = tracer.finish(trace, status)
+    if not record or not config.get('tracing', {}).get('status_readout', True):
+        return ""
+    return tracer.readout(record)
+
+def interrupt_playback():
+    if active_turn is not None and not active_turn.done():
+        active_turn.cancel()
+    if current_trace:
+        current_trace.set(cancelled=True)
+    tts_pipeline.cancel_pending()
+    audio_player.stop_and_clear()
+
+def interrupt_greeting():
+    if not greeting_active or app_state not in ["processing", "speaking", "paused"]:
+        return
+    print("--- Greeting interrupted by new input ---")
+    interrupt_playback()
+    set_application_state("idle")
 
-def handle_start_voice(model_key):
+def handle_start_voice(model_key, received_at=None, source=None):
+    interrupt_greeting()
     if app_state != "idle":
         return
-    global staged_model_key, ACTIVE_VOICE_THREAD
+    global staged_model_key
     staged_model_key = model_key
-    cancellation_event.clear()
+    begin_turn_trace('voice', model_key, received_at)
     stop_listening_event.clear()
     model_name = config['models'].get(model_key, 'Unknown Model')
     set_application_state("listening", f"🎙️ Listening to {model_name}...")
-    ACTIVE_VOICE_THREAD = threading.Thread(target=_voice_input_thread, daemon=True)
-    ACTIVE_VOICE_THREAD.start()
+    if source is not None and current_trace:
+        current_trace.set(barge_in=True)
+    start_turn(_voice_turn(source))
 
 def handle_stop_listening():
     if app_state == "listening":
+        if current_trace:
+            current_trace.mark('listening_stop')
         stop_listening_event.set()
 
-def _voice_input_thread():
-    transcript = listen_and_transcribe(clients[1], config['audio_settings'], ui_queue)
-    if cancellation_event.is_set():
+async def _voice_turn(source=None):
+    speculator.begin(staged_model_key)
+    try:
+        transcript = await listen_and_transcribe(clients[1], config['audio_settings'], ui_queue, current_trace, speculator.observe, source)
+        if transcript:
+            if stage_request(transcript, "listening"):
+                speculation = speculator.claim(staged_input, master_history.snapshot().version)
+                await _request_and_speak_turn(staged_model_key, staged_input, speculation)
+        else:
+            set_application_state("idle", "❌ No audio detected. Action cancelled.")
+    finally:
+        speculator.end()
+        if source is not None:
+            source.stop()
+
+def start_turn(coro):
+    global active_turn, pending_cancel
+    pending_cancel = None
+    connections.touch()
+    active_turn = asyncio.create_task(coro)
+    active_turn.add_done_callback(_on_turn_done)
+    return active_turn
+
+def _on_turn_done(task):
+    if task.cancelled() or task.exception() is None:
         return
-    if transcript:
-        handle_send_request(transcript, "listening")
-    else:
-        set_application_state("idle", "❌ No audio detected. Action cancelled.")
+    print(f"❌ Turn failed: {task.exception()}")
+    set_application_state("idle", "❌ Something went wrong. Check console.")
 
-def listen_and_transcribe(speech_client, audio_settings, gui_queue):
-    audio_queue = Queue()
-    final_transcript_container = [""]
+async def listen_and_transcribe(speech_client, audio_settings, gui_queue, trace=None, on_transcript=None, source=None):
+    loop = asyncio.get_running_loop()
+    audio_queue = asyncio.Queue()
     pyaudio_format, channels, rate, chunk = audio_settings['audio_format_pyaudio'], audio_settings['channels'], audio_settings['rate'], audio_settings['chunk_size']
 
-    def _audio_recorder():
-        p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio_format, channels=channels, rate=rate, input=True, frames_per_buffer=chunk)
-        while not stop_listening_event.is_set() and not cancellation_event.is_set():
-            try:
-                audio_queue.put(stream.read(chunk, exception_on_overflow=False))
-            except (IOError, OSError):
+    def _on_audio(in_data, frame_count, time_info, status):
+        loop.call_soon_threadsafe(audio_queue.put_nowait, in_data)
+        return None, pyaudio.paContinue
+
+    def _upload(payload):
+        if trace:
+            trace.add('stt_upload_bytes', len(payload))
+        return speech.StreamingRecognizeRequest(audio_content=payload)
+
+    async def _requests():
+        config_rec = speech.RecognitionConfig(encoding=getattr(speech.RecognitionConfig.AudioEncoding, stt_encoding), sample_rate_hertz=rate, audio_channel_count=channels, language_code="en-US", enable_automatic_punctuation=True)
+        yield speech.StreamingRecognizeRequest(streaming_config=speech.StreamingRecognitionConfig(config=config_rec, interim_results=True))
+        while True:
+            chunk_data = await audio_queue.get()
+            if chunk_data is None:
                 break
-        audio_queue.put(None)
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
-
-    def _stream_transcriber():
-        def _audio_generator():
-            while True:
-                chunk_data = audio_queue.get()
-                if chunk_data is None:
-                    return
-                yield speech.StreamingRecognizeRequest(audio_content=chunk_data)
-
-        config_rec = speech.RecognitionConfig(encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16, sample_rate_hertz=rate, language_code="en-US", enable_automatic_punctuation=True)
-        streaming_config = speech.StreamingRecognitionConfig(config=config_rec, interim_results=True)
-        try:
-            responses = speech_client.streaming_recognize(config=streaming_config, requests=_audio_generator())
-            finalized_parts = []
-            for r in responses:
-                if cancellation_event.is_set() or stop_listening_event.is_set():
-                    break
-                if r.results and r.results[0].alternatives:
-                    phrase = r.results[0].alternatives[0].transcript
-                    if r.results[0].is_final:
-                        finalized_parts.append(phrase.strip())
-                    combined_text = ' '.join(finalized_parts + ([phrase] if not r.results[0].is_final else []))
-                    gui_queue.put(("update_entry", combined_text))
-            final_transcript_container[0] = ' '.join(finalized_parts)
-        except Exception as e:
-            if not cancellation_event.is_set():
-                print(f"⚠️  Speech recognition stream ended: {e}")
+            for voiced_data in vad.process(chunk_data):
+                payload = encoder.encode(voiced_data) if encoder else voiced_data
+                if payload:
+                    yield _upload(payload)
+            if vad.endpoint:
+                print(f"--- VAD endpoint ({vad.endpoint}). Ending utterance. ---")
+                if trace:
+                    trace.mark('vad_endpoint')
+                handle_stop_listening()
+                break
+        if encoder:
+            tail = encoder.finish()
+            if tail:
+                yield _upload(tail)
+
+    async def _collect():
+        responses = await speech_client.streaming_recognize(requests=_requests())
+        async for r in responses:
+            if r.results and r.results[0].alternatives:
+                phrase = r.results[0].alternatives[0].transcript
+                if trace:
+                    trace.mark('stt_first_interim')
+                if r.results[0].is_final:
+                    finalized_parts.append(phrase.strip())
+                    if trace:
+                        trace.mark('stt_final', overwrite=True)
+                combined_text = ' '.join(finalized_parts + ([phrase] if not r.results[0].is_final else []))
+                gui_queue.put(("update_entry", combined_text))
+                if on_transcript:
+                    on_transcript(combined_text)
+
+    async def _end_audio_on_stop():
+        nonlocal final_timed_out
+        await stop_listening_event.wait()
+        audio_queue.put_nowait(None)
+        final_deadline = deadlines['stt_final_s']
+        if final_deadline:
+            await asyncio.sleep(final_deadline)
+            if not collector.done():
+                print(f"⚠️  No final transcript within {final_deadline:g}s of the end of speech. Using what was recognized so far.")
+                final_timed_out = True
+                collector.cancel()
+
+    vad = VoiceActivityDetector(audio_settings.get('vad', {}), rate, chunk, audio_player.pa.get_sample_size(pyaudio_format))
+    stt_encoding = audio_settings.get('stt_encoding', 'LINEAR16')
+    encoder = StreamingEncoder(stt_encoding, rate, channels) if stt_encoding != 'LINEAR16' else None
+    stream = await source.handover(_on_audio) if source is not None else None
+    if stream is None:
+        stream = await open_input_stream(audio_player.pa, format=pyaudio_format, channels=channels, rate=rate, frames_per_buffer=chunk, stream_callback=_on_audio)
+    finalized_parts = []
+    final_timed_out = False
+    collector = asyncio.ensure_future(_collect())
+    stopper = asyncio.create_task(_end_audio_on_stop())
+    if trace:
+        trace.mark('listening_start')
+    try:
+        await collector
+    except asyncio.CancelledError:
+        if not final_timed_out:
+            raise
+        if trace:
+            trace.set(stt_deadline_hit=True)
+    except Exception as e:
+        print(f"⚠️  Speech recognition stream ended: {e}")
+    finally:
+        stopper.cancel()
+        collector.cancel()
+        close_stream_soon(stream)
+        vad_stats = vad.stats()
+        print(f"--- VAD: sent {vad_stats['sent']}/{vad_stats['chunks']} chunks, suppressed {vad_stats['suppressed_ratio']:.0%} of audio, endpoint {vad_stats['endpoint'] or 'manual'}. ---")
+        if trace:
+            trace.mark('stt_done')
+            trace.set(vad=vad_stats, stt_encoding=stt_encoding)
+
+    return ' '.join(finalized_parts).strip()
+
+async def open_input_stream(pa, **stream_args):
+    opener = asyncio.ensure_future(asyncio.to_thread(pa.open, input=True, **stream_args))
+    try:
+        return await asyncio.shield(opener)
+    except asyncio.CancelledError:
+        opener.add_done_callback(lambda done: close_stream_soon(done.result()) if not done.cancelled() and done.exception() is None else None)
+        raise
 
-    recorder = threading.Thread(target=_audio_recorder, daemon=True)
-    transcriber = threading.Thread(target=_stream_transcriber, daemon=True)
-    recorder.start()
-    transcriber.start()
-    recorder.join()
-    transcriber.join()
+def close_stream_soon(stream):
+    asyncio.get_running_loop().run_in_executor(None, _close_audio_stream, stream)
 
-    return final_transcript_container[0].strip()
+def _close_audio_stream(stream):
+    try:
+        stream.stop_stream()
+        stream.close()
+    except Exception as e:
+        print(f"⚠️  Could not close audio stream: {e}")
 
 def handle_start_text(model_key):
+    interrupt_greeting()
     if app_state != "idle":
         return
     global staged_model_key
     staged_model_key = model_key
-    cancellation_event.clear()
     model_name = config['models'].get(model_key, 'Unknown Model')
     set_application_state("awaiting_text", f"⌨️ Awaiting text for {model_name}...")
 
-def handle_send_request(user_input, from_state):
+def handle_send_request(user_input, from_state, received_at=None):
+    if app_state == from_state and user_input.strip():
+        begin_turn_trace('text', staged_model_key, received_at)
+    if stage_request(user_input, from_state):
+        start_turn(_request_and_speak_turn(staged_model_key, staged_input))
+
+def stage_request(user_input, from_state):
     global staged_input
     if app_state != from_state:
-        return
+        return False
 
     if not user_input.strip():
         handle_cancel_action()
-        return
+        return False
 
     staged_input = user_input
+    if current_trace:
+        current_trace.mark('request_staged')
     model_name = config['models'].get(staged_model_key, 'Unknown Model')
     set_application_state("processing", f"🧠 Processing with {model_name}...")
-    threading.Thread(target=_request_and_speak_thread, daemon=True).start()
-
-def _request_and_speak_thread():
-    local_model_key = staged_model_key
-    local_input = staged_input
+    return True
 
-    global master_history, model_caches, cache_source_lens
+async def _request_and_speak_turn(local_model_key, local_input, speculation=None):
+    speech_stream = StreamingSpeaker(config) if config.get('streaming', {}).get('enabled', False) else None
+    try:
+        await _request_and_speak(local_model_key, local_input, speech_stream, speculation)
+    except asyncio.CancelledError:
+        if speech_stream:
+            speech_stream.abort()
+            speech_stream = None
+        raise
+    finally:
+        if speech_stream:
+            await speech_stream.close()
+
+async def _generate_reply(model, contents, speech_stream, received_parts, usage, trace=None):
+    if trace:
+        trace.mark('llm_request', overwrite=True)
+    if speech_stream is None:
+        response = await wait_stage(model.generate_content_async(contents), 'llm_total', deadlines['llm_total_s'])
+        if trace:
+            trace.mark('llm_first_byte')
+            trace.mark('llm_complete')
+        _record_usage(response, usage)
+        return response.text
+    response = await wait_stage(model.generate_content_async(contents, stream=True), 'llm_first_byte', deadlines['llm_first_byte_s'])
+    async for chunk in stream_with_deadlines(response, 'llm', deadlines['llm_first_byte_s'], deadlines['llm_total_s']):
+        if trace:
+            trace.mark('llm_first_byte')
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        received_parts.append(text)
+        await speech_stream.feed(text)
+    if trace:
+        trace.mark('llm_complete')
+    _record_usage(response, usage)
+    return "".join(received_parts)
+
+async def _prefetch_reply(prefetch):
+    user_tokens = master_history.estimate(prefetch.text, prefetch.model_key)
+    model, contents, current_cache, _, snapshot = _prepare_request(prefetch.model_key, make_turn('user', prefetch.text), user_tokens)
+    prefetch.history_version, prefetch.cached = snapshot.version, current_cache is not None
+    prefetch.prompt_tokens = snapshot.total_tokens() + user_tokens
+    try:
+        response = await wait_stage(model.generate_content_async(contents, stream=True), 'llm_first_byte', deadlines['llm_first_byte_s'])
+        async for chunk in stream_with_deadlines(response, 'llm', deadlines['llm_first_byte_s'], deadlines['llm_total_s']):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            prefetch.push(text)
+    except Exception as e:
+        if current_cache is not None and not prefetch.parts and "CachedContent not found" in str(e):
+            print(f"⚠️  Cache for '{prefetch.model_key}' has expired. Dropping it so it rebuilds.")
+            cache_manager.invalidate(prefetch.model_key, current_cache)
+        raise
+    _record_usage(response, prefetch.usage)
+
+async def _adopt_speculation(speculation, speech_stream, received_parts, usage, trace=None):
+    lead_ms = (time.perf_counter() - speculation.started_at) * 1000
+    print(f"--- SPECULATIVE HIT: Reusing the reply requested {lead_ms:.0f} ms ago. {speculator.summary()} ---")
+    if trace:
+        trace.mark('llm_request', speculation.started_at, overwrite=True)
+        trace.set(path='speculative', speculation_lead_ms=round(lead_ms, 1), cache_hit=speculation.cached)
+    return await _consume_prefetch(speculation, "Speculative", speech_stream, received_parts, usage, trace)
+
+async def _routed_reply(local_model_key, local_input, speech_stream, received_parts, usage, trace=None):
+    if trace:
+        trace.mark('llm_request', overwrite=True)
+    winner = await router.race(local_input, local_model_key, _prefetch_reply)
+    if winner is None:
+        print(f"⚠️  Routed requests failed. Re-issuing to '{local_model_key.upper()}'. {router.summary()}")
+        return "", local_model_key
+    if winner.model_key != local_model_key:
+        print(f"--- ROUTED: '{winner.model_key.upper()}' answered first for '{local_model_key.upper()}'. {router.summary()} ---")
+    if trace:
+        trace.set(answered_by=winner.model_key, cache_hit=winner.cached)
+    try:
+        return await _consume_prefetch(winner, "Routed", speech_stream, received_parts, usage, trace), winner.model_key
+    finally:
+        if not winner.done:
+            winner.task.cancel()
+
+async def _consume_prefetch(prefetch, label, speech_stream, received_parts, usage, trace=None):
+    async for text in prefetch.stream():
+        if trace:
+            trace.mark('llm_first_byte', prefetch.first_byte_at)
+        received_parts.append(text)
+        if speech_stream:
+            await speech_stream.feed(text)
+    if prefetch.error is not None:
+        if not received_parts:
+            print(f"⚠️  {label} request failed ({prefetch.error!r}). Re-issuing it.")
+            return ""
+        print(f"⚠️  {label} stream interrupted after {len(received_parts)} chunks: {prefetch.error}")
+    if trace:
+        trace.mark('llm_complete')
+    cache_manager.record_request(prefetch.model_key, prefetch.cached)
+    usage.update(prefetch.usage)
+    return "".join(received_parts)
+
+def _prepare_request(local_model_key, user_turn, user_tokens):
+    current_cache, cached_raw_len = cache_manager.acquire(local_model_key)
+    snapshot = master_history.snapshot()
+    total_tokens = snapshot.total_tokens() + user_tokens
+    cached_len = snapshot.live_length(cached_raw_len)
+    if total_tokens < MINIMUM_CACHE_TOKENS or cached_len is None or cached_len > len(snapshot):
+        current_cache, cached_len = None, 0
+    if current_cache is None:
+        path = 'bootstrap' if total_tokens < MINIMUM_CACHE_TOKENS else 'rebuild'
+        model = connections.model(local_model_key)
+    else:
+        path = 'catch_up'
+        model = connections.model(local_model_key, current_cache)
+    return model, snapshot.turns(cached_len) + [user_turn], current_cache, path, snapshot
+
+async def _summarize_history(model_key, system_instruction, contents):
+    model = backend.generative_model(config['models'][model_key], system_instruction)
+    response = await wait_stage(model.generate_content_async(contents), 'llm_total', deadlines['llm_total_s'])
+    return response.text
+
+def _record_usage(response, usage):
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is None:
+        return
+    for field in ('prompt_token_count', 'cached_content_token_count', 'candidates_token_count'):
+        value = getattr(metadata, field, 0)
+        if value:
+            usage[field] = value
 
+async def _request_and_speak(local_model_key, local_input, speech_stream, speculation=None):
     ui_queue.put(("history", f"You: {local_input}"))
     print(f"\n[You]: {local_input}")
 
     raw_ai_response = ""
     is_request_successful = False
-
-    with history_lock:
-        master_history.append({'role': 'user', 'parts': [{'text': local_input}]})
-
+    received_parts = []
+    usage = {}
+
+    trace = current_trace
+    user_turn = make_turn('user', local_input)
+    user_tokens = master_history.estimate(local_input, local_model_key)
+
+    answered_by = local_model_key
+    connections.touch(local_model_key)
+    if speculation is not None:
+        raw_ai_response = await _adopt_speculation(speculation, speech_stream, received_parts, usage, trace)
+        is_request_successful = bool(raw_ai_response)
+    elif router.enabled:
+        raw_ai_response, answered_by = await _routed_reply(local_model_key, local_input, speech_stream, received_parts, usage, trace)
+        is_request_successful = bool(raw_ai_response)
     while not is_request_successful:
-        if cancellation_event.is_set():
-            return
-
+        current_cache = None
         try:
-            model_name = config['models'][local_model_key]
+            model, final_content, current_cache, path, snapshot = _prepare_request(local_model_key, user_turn, user_tokens)
+            if path == 'bootstrap':
+                print(f"--- BOOTSTRAP MODE (History < {MINIMUM_CACHE_TOKENS} tokens). Sending full history... ---")
+            elif path == 'rebuild':
+                print(f"--- UNCACHED MODE: No ready cache for '{local_model_key.upper()}'. Sending full history while it builds in the background... ---")
+            else:
+                print(f"--- CATCH-UP MODE: Using existing cache and sending {len(final_content)} diff turns. ---")
+
+            cache_manager.record_request(local_model_key, current_cache is not None)
+            if trace:
+                trace.set(path=path, cache_hit=current_cache is not None, context_turns=len(final_content), history_version=snapshot.version)
+            print(f"    -> [{local_model_key.upper()}] Sending {len(final_content)} turns as context (history v{snapshot.version}).")
+            raw_ai_response = await _generate_reply(model, final_content, speech_stream, received_parts, usage, trace)
             
-            with history_lock:
-                total_tokens = estimate_token_count(master_history)
-
-                if total_tokens < MINIMUM_CACHE_TOKENS:
-                    print(f"--- BOOTSTRAP MODE (History < {MINIMUM_CACHE_TOKENS} tokens). Sending full history... ---")
-                    model = genai.GenerativeModel(model_name=model_name, system_instruction=config['system_instruction'])
-                    final_content = master_history
-                    print(f"    -> [{local_model_key.upper()}] Sending {len(final_content)} turns as context.")
-                    response = model.generate_content(final_content)
-                    raw_ai_response = response.text
-                else:
-                    current_cache = model_caches.get(local_model_key)
-                    last_known_len = cache_source_lens.get(local_model_key, 0)
-                    history_diff = master_history[last_known_len:]
-                    
-                    rebuild_reason = None
-                    if current_cache is None:
-                        rebuild_reason = f"NEW CACHE for '{local_model_key.upper()}'"
-                    elif len(history_diff) >= CACHE_COMPACTION_THRESHOLD:
-                        rebuild_reason = f"CACHE COMPACTION: Diff of {len(history_diff)} turns exceeds threshold ({CACHE_COMPACTION_THRESHOLD})"
-                    else:
-                        diff_tokens = estimate_token_count(history_diff)
-                        if diff_tokens >= DIFF_TOKEN_REBUILD_THRESHOLD:
-                            rebuild_reason = f"CACHE COMPACTION: Diff tokens ({int(diff_tokens)}) exceed threshold ({DIFF_TOKEN_REBUILD_THRESHOLD})"
-                    
-                    if rebuild_reason:
-                        print(f"--- BOOTSTRAP/REBUILD MODE: {rebuild_reason}. Rebuilding... ---")
-                        if current_cache:
-                            try:
-                                current_cache.delete()
-                            except Exception as e:
-                                print(f"⚠️  Could not delete old cache (it may have already expired): {e}")
-                        
-                        history_for_caching = master_history[:-1]
-                        current_cache = genai.caching.CachedContent.create(
-                            model=f"models/{model_name}",
-                            system_instruction=config['system_instruction'],
-                            contents=history_for_caching
-                        )
-                        model_caches[local_model_key] = current_cache
-                        cache_source_lens[local_model_key] = len(history_for_caching)
-                    else:
-                        print(f"--- CATCH-UP MODE: Using existing cache and sending {len(history_diff)} diff turns. ---")
-                    
-                    model = genai.GenerativeModel.from_cached_content(cached_content=current_cache)
-                    final_content = master_history[cache_source_lens.get(local_model_key, 0):]
-                    print(f"    -> [{local_model_key.upper()}] Sending {len(final_content)} turns as context.")
-                    response = model.generate_content(final_content)
-                    raw_ai_response = response.text
-                
-                is_request_successful = True
+            is_request_successful = True
 
         except Exception as e:
-            if "CachedContent not found" in str(e):
-                print(f"⚠️  Cache for '{local_model_key}' has expired. Deleting local reference and retrying silently.")
-                if local_model_key in model_caches:
-                    del model_caches[local_model_key]
-                if local_model_key in cache_source_lens:
-                    del cache_source_lens[local_model_key]
+            if received_parts:
+                print(f"⚠️  Gemini stream interrupted after {len(received_parts)} chunks: {e}")
+                raw_ai_response = "".join(received_parts)
+                is_request_successful = True
+            elif current_cache is not None and "CachedContent not found" in str(e):
+                print(f"⚠️  Cache for '{local_model_key}' has expired. Dropping it and retrying uncached while it rebuilds.")
+                cache_manager.invalidate(local_model_key, current_cache)
+                if trace:
+                    trace.set(cache_expired_retry=True)
                 continue
             else:
                 print(f"❌ Gemini Error: {e}")
-                raw_ai_response = "<speak>I seem to be having trouble connecting to my brain.</speak>"
+                raw_ai_response = BRAIN_ERROR_SSML
                 is_request_successful = True
+                if speech_stream:
+                    await speech_stream.feed(raw_ai_response)
 
-    with history_lock:
-        if raw_ai_response:
-            master_history.append({'role': 'model', 'parts': [{'text': raw_ai_response}]})
-        else:
-            if master_history and master_history[-1]['role'] == 'user':
-                master_history.pop()
-            return
+    if not raw_ai_response:
+        return
 
-    if cancellation_event.is_set():
+    output_tokens = usage.get('candidates_token_count')
+    version, turn_tokens = master_history.append((user_turn, answered_by, None), (make_turn('model', raw_ai_response), answered_by, output_tokens))
+    master_history.calibrate(answered_by, len(raw_ai_response), output_tokens)
+    if trace and usage:
+        trace.set(**usage)
+    if 'prompt_token_count' in usage:
+        print(f"    -> Tokens: prompt {usage['prompt_token_count']} (cached {usage.get('cached_content_token_count', 0)}), reply {output_tokens or 0}; history v{version} total {int(master_history.snapshot().total_tokens())}.")
+    if answered_by != local_model_key:
+        cache_manager.notify_history_changed(answered_by)
+    cache_manager.notify_history_changed(local_model_key)
+    summarizer.maybe_start()
+
+    reply = speech_stream.document() if speech_stream else parse_ssml(raw_ai_response)
+    first_index = log_conversation_turn(answered_by, [('user', local_input, turn_tokens[0]), ('model', raw_ai_response, turn_tokens[1])], local_input, reply)
+
+    print(f"[Diane]: {reply.ssml}")
+    if first_index is not None:
+        ui_queue.put(("history_index", first_index))
+    ui_queue.put(("history", (f"Diane: {reply.plain_text}", first_index + 1 if first_index is not None else None)))
+
+    if speech_stream:
         return
 
-    sanitized_ssml = sanitize_ssml(raw_ai_response)
-    print(f"[Diane]: {sanitized_ssml}")
-    log_conversation_turn(config['log_filename'], local_model_key, local_input, sanitized_ssml)
-    ui_queue.put(("history", f"Diane: {strip_ssml_tags(sanitized_ssml)}"))
+    await speak_ssml(reply.ssml)
 
-    audio_files = create_audio_chunks(sanitized_ssml, clients[0], config)
+class StreamingSpeaker:
+    def __init__(self, config):
+        self.config = config
+        self.segmenter = SSMLStreamSegmenter(config['streaming'].get('min_segment_chars', 60))
+        self.segments_sent = 0
+        self.generation = tts_pipeline.current_generation()
+        self.trace = current_trace
+        audio_player.begin_feed()
 
-    if cancellation_event.is_set():
-        for f in audio_files:
-            if os.path.exists(f):
-                os.remove(f)
-        return
+    async def feed(self, text):
+        for segment in self.segmenter.feed(text):
+            await self._submit(segment)
 
-    if audio_files:
-        set_application_state("speaking")
-        audio_player.play_files(audio_files)
-    else:
-        set_application_state("idle")
+    async def close(self):
+        try:
+            for segment in self.segmenter.flush():
+                await self._submit(segment)
+            await tts_pipeline.submit_marker(_finish_speech_feed, self.generation)
+        except asyncio.CancelledError:
+            self.abort()
+            raise
 
-def handle_cancel_action():
-    print("--- CANCEL ACTION TRIGGERED ---")
-    cancellation_event.set()
-    stop_listening_event.set()
+    def document(self):
+        return self.segmenter.tokenizer.close()
 
-    global ACTIVE_VOICE_THREAD
-    if ACTIVE_VOICE_THREAD and ACTIVE_VOICE_THREAD.is_alive():
-        ACTIVE_VOICE_THREAD.join()
+    def abort(self):
+        audio_player.end_feed(settle_state=False)
 
-    audio_player.stop_and_clear()
+    async def _submit(self, segment):
+        await create_audio_chunks(segment, self.config, self.generation, is_first_segment=self.segments_sent == 0, trace=self.trace)
+        self.segments_sent += 1
 
-    global staged_input, staged_model_key
+def handle_cancel_action(received_at=None):
+    global staged_input, staged_model_key, pending_cancel
+    print("--- CANCEL ACTION TRIGGERED ---")
+    requested_at = received_at if received_at is not None else time.perf_counter()
+    if current_trace:
+        current_trace.mark('cancel_requested', requested_at)
+    turn = active_turn
+    stop_listening_event.set()
+    interrupt_playback()
     staged_input = ""
     staged_model_key = ""
 
+    token = pending_cancel = object()
+    if turn is None or turn.done():
+        _finish_cancel(token, requested_at)
+        return
+    turn.add_done_callback(lambda _: _finish_cancel(token, requested_at))
+    audio_player.loop.call_later(deadlines['cancel_grace_ms'] / 1000, _finish_cancel, token, requested_at, True)
+
+def _finish_cancel(token, requested_at, forced=False):
+    global pending_cancel
+    if token is not pending_cancel:
+        return
+    pending_cancel = None
+    if current_trace:
+        current_trace.mark('cancel_idle')
     set_application_state("idle", "❌ Action cancelled.")
+    elapsed_ms = (time.perf_counter() - requested_at) * 1000
+    if forced:
+        print(f"⚠️  Cancelled turn did not release within {deadlines['cancel_grace_ms']} ms. Returned to idle anyway.")
+    elif elapsed_ms > deadlines['cancel_budget_ms']:
+        print(f"⚠️  Cancel took {elapsed_ms:.0f} ms to reach idle (budget {deadlines['cancel_budget_ms']} ms).")
+
+class SpeechSynthesisPipeline:
+    def __init__(self, tts_client, config):
+        self.tts_client = tts_client
+        self.audio_settings = config['audio_settings']
+        self.request_slots = asyncio.Semaphore(config['tts_limits'].get('max_parallel_requests', 4))
+        self.ordered_items = asyncio.Queue(maxsize=config['tts_limits'].get('max_queued_chunks', 16))
+        self.generation = 0
+        self.in_flight = set()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    def current_generation(self):
+        return self.generation
+
+    async def submit(self, ssml_chunk, generation, label="", cache_key=None, trace=None):
+        if generation != self.generation:
+            return False
+        task = asyncio.create_task(self._synthesize(ssml_chunk, label, cache_key, trace))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        await self.ordered_items.put((generation, task))
+        return True
+
+    async def submit_audio(self, audio_buffer, generation):
+        if generation != self.generation:
+            return False
+        await self.ordered_items.put((generation, audio_buffer))
+        return True
+
+    async def submit_marker(self, callback, generation):
+        await self.ordered_items.put((generation, callback))
+
+    def cancel_pending(self):
+        self.generation += 1
+        for task in list(self.in_flight):
+            task.cancel()
+
+    async def _synthesize(self, ssml_chunk, label, cache_key, trace):
+        async with self.request_slots:
+            print(f"    -> Synthesizing chunk {label} ({len(ssml_chunk.encode('utf-8'))} bytes)...")
+            if trace is None:
+                return await _synthesize_single_chunk(ssml_chunk, self.tts_client, self.audio_settings, cache_key)
+            trace.mark('tts_first_request')
+            span = trace.start_span('tts_chunk', label=label, bytes=len(ssml_chunk.encode('utf-8')), cached=False)
+            audio_buffer = await _synthesize_single_chunk(ssml_chunk, self.tts_client, self.audio_settings, cache_key, span)
+            trace.end_span(span, ok=audio_buffer is not None)
+            trace.add('tts_download_bytes', span.get('audio_bytes', 0))
+            trace.mark('tts_first_response')
+            return audio_buffer
+
+    async def _dispatch(self):
+        while True:
+            generation, item = await self.ordered_items.get()
+            if isinstance(item, asyncio.Task):
+                if generation != self.generation:
+                    item.cancel()
+                    continue
+                await asyncio.wait([item])
+                if item.cancelled():
+                    continue
+                if item.exception() is not None:
+                    print(f"❌ TTS pipeline error: {item.exception()}")
+                    continue
+                item = item.result()
+            elif not isinstance(item, AudioBuffer):
+                try:
+                    item(generation != self.generation)
+                except Exception as e:
+                    print(f"❌ TTS pipeline marker error: {e}")
+                continue
+            if item is None or generation != self.generation:
+                continue
+            audio_player.play_buffers([item])
+
+def _finish_speech_feed(is_stale):
+    audio_player.end_feed(settle_state=not is_stale)
 
-def create_audio_chunks(sanitized_ssml, tts_client, config):
+async def speak_ssml(sanitized_ssml):
+    generation = tts_pipeline.current_generation()
+    trace = current_trace
+    audio_player.begin_feed()
+    try:
+        await create_audio_chunks(sanitized_ssml, config, generation, trace=trace)
+        await tts_pipeline.submit_marker(_finish_speech_feed, generation)
+    except asyncio.CancelledError:
+        audio_player.end_feed(settle_state=False)
+        raise
+
+async def create_audio_chunks(sanitized_ssml, config, generation, is_first_segment=True, trace=None):
     byte_limit = config['tts_limits']['byte_limit_for_long_audio']
-    ssml_chunks = _split_ssml_into_chunks(sanitized_ssml, byte_limit)
+    first_chunk_limit = config['tts_limits'].get('first_chunk_byte_limit') if is_first_segment else None
+    ssml_chunks = split_ssml(sanitized_ssml, byte_limit, first_chunk_limit)
     print(f"--- Split into {len(ssml_chunks)} audio chunks. ---")
-    
-    audio_files = []
-    for i, ssml_chunk in enumerate(ssml_chunks):
-        if cancellation_event.is_set() or not strip_ssml_tags(ssml_chunk).strip():
-            continue
-        print(f"    -> Synthesizing chunk {i+1}/{len(ssml_chunks)} ({len(ssml_chunk.encode('utf-8'))} bytes)...")
-        filepath = _synthesize_single_chunk(ssml_chunk, tts_client, config['audio_settings'])
-        if filepath:
-            audio_files.append(filepath)
-    return audio_files
 
-def _synthesize_single_chunk(ssml_text, client, audio_settings):
+    queued = 0
+    for i, ssml_chunk in enumerate(ssml_chunks):
+        cache_key = tts_cache_key(ssml_chunk, config['audio_settings']) if tts_cache else None
+        cached_audio = await lookup_tts_cache(cache_key) if cache_key else None
+        if cached_audio is not None:
+            print(f"    -> Chunk {i+1}/{len(ssml_chunks)} served from TTS cache.")
+            if trace:
+                trace.end_span(trace.start_span('tts_chunk', label=f"{i+1}/{len(ssml_chunks)}", bytes=len(ssml_chunk.encode('utf-8')), cached=True), ok=True)
+            submitted = await tts_pipeline.submit_audio(await decode_tts_audio(cached_audio, config['audio_settings']), generation)
+        else:
+            submitted = await tts_pipeline.submit(ssml_chunk, generation, f"{i+1}/{len(ssml_chunks)}", cache_key, trace)
+        if submitted:
+            queued += 1
+    return queued
+
+async def lookup_tts_cache(cache_key):
+    cached_audio = tts_cache.get_from_memory(cache_key)
+    if cached_audio is None:
+        cached_audio = await asyncio.to_thread(tts_cache.get, cache_key)
+    return cached_audio
+
+def tts_cache_key(ssml_text, audio_settings):
+    return TTSAudioCache.make_key(ssml_text, audio_settings['voice_name'], audio_settings['pitch_modifier'], audio_settings.get('tts_encoding', 'LINEAR16'))
+
+async def prewarm_tts_cache(phrases, tts_client, audio_settings):
+    for phrase in phrases:
+        cache_key = tts_cache_key(phrase, audio_settings)
+        if await lookup_tts_cache(cache_key) is None:
+            await _synthesize_single_chunk(phrase, tts_client, audio_settings, cache_key)
+    print(f"--- TTS cache ready: {tts_cache.stats()} ---")
+
+async def _synthesize_single_chunk(ssml_text, client, audio_settings, cache_key=None, span=None):
+    encoding = audio_settings.get('tts_encoding', 'LINEAR16')
     s_input = texttospeech.SynthesisInput(ssml=ssml_text)
     voice = texttospeech.VoiceSelectionParams(language_code='-'.join(audio_settings['voice_name'].split('-')[:2]), name=audio_settings['voice_name'])
-    a_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.LINEAR16, pitch=audio_settings['pitch_modifier'])
+    a_config = texttospeech.AudioConfig(audio_encoding=getattr(texttospeech.AudioEncoding, encoding), pitch=audio_settings['pitch_modifier'])
     try:
-        response = client.synthesize_speech(input=s_input, voice=voice, audio_config=a_config)
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_f:
-            temp_f.write(response.audio_content)
-            return temp_f.name
+        response = await wait_stage(client.synthesize_speech(input=s_input, voice=voice, audio_config=a_config), 'tts_chunk', deadlines['tts_chunk_s'])
+        if span is not None:
+            span['audio_bytes'] = len(response.audio_content)
+        if audio_settings.get('debug_dump_dir'):
+            dump_audio_for_debug(response.audio_content, audio_settings['debug_dump_dir'], FILE_EXTENSIONS[encoding])
+        audio_buffer = await decode_tts_audio(response.audio_content, audio_settings)
+        if cache_key and tts_cache:
+            asyncio.get_running_loop().run_in_executor(None, tts_cache.put, cache_key, response.audio_content)
+        return audio_buffer
     except Exception as e:
         print(f"❌ TTS Error (chunk): {e}")
         return None
 
-def _split_ssml_into_chunks(ssml_text, byte_limit):
-    try:
-        source_root = ET.fromstring(ssml_text)
-        if len(ssml_text.encode('utf-8')) > byte_limit:
-            print(f"--- SSML is valid and exceeds {byte_limit} bytes. Splitting by structure... ---")
-            return _split_by_structure(source_root, byte_limit)
-        else:
-            print(f"--- SSML is valid and within byte limit. No splitting needed. ---")
-            return [ssml_text]
-    except ET.ParseError as e:
-        print(f"❌ SSML Parse Error: {e}. Salvaging text and splitting by sentence. ---")
-        plain_text = strip_ssml_tags(ssml_text)
-        return _split_by_sentence(plain_text, byte_limit)
-
-def _split_by_structure(source_root, byte_limit):
-    final_chunks = []
-    current_chunk_root = ET.Element(source_root.tag, source_root.attrib)
-
-    for elem in list(source_root):
-        elem_str = ET.tostring(elem, encoding='unicode')
-        current_chunk_str = ET.tostring(current_chunk_root, encoding='unicode')
-        
-        if len(current_chunk_str.encode('utf-8')) + len(elem_str.encode('utf-8')) > byte_limit and len(list(current_chunk_root)) > 0:
-            final_chunks.append(ET.tostring(current_chunk_root, encoding='unicode'))
-            current_chunk_root = ET.Element(source_root.tag, source_root.attrib)
-        
-        current_chunk_root.append(elem)
-
-    if len(list(current_chunk_root)) > 0:
-        final_chunks.append(ET.tostring(current_chunk_root, encoding='unicode'))
-
-    return final_chunks
-
-def _split_by_sentence(plain_text, byte_limit):
-    chunks = []
-    current_chunk_text = ""
-    sentences = re.split(r'(?<=[.!?])\s+', plain_text)
-    
-    for sentence in sentences:
-        if not sentence.strip():
-            continue
-        
-        if len(current_chunk_text.encode('utf-8')) + len(sentence.encode('utf-8')) > byte_limit and current_chunk_text:
-            chunks.append(f"<speak>{current_chunk_text.strip()}</speak>")
-            current_chunk_text = ""
-            
-        current_chunk_text += sentence + " "
-        
-    if current_chunk_text.strip():
-        chunks.append(f"<speak>{current_chunk_text.strip()}</speak>")
-        
-    return chunks
-
-def log_conversation_turn(filename, model_key, user_input, raw_ai_response):
+def open_session_store(config):
+    store_settings = config.get('session_store', {})
+    store = SessionStore.open_session(
+        store_settings.get('directory', "sessions"),
+        resume=store_settings.get('resume', True),
+        fsync_interval=store_settings.get('fsync_interval_seconds', 2.0),
+        batch_interval=store_settings.get('batch_interval_seconds', 0.25),
+        text_log_path=config['log_filename'] if store_settings.get('text_log', True) else None
+    )
+    if len(store):
+        master_history.append(*[(turn, None, tokens) for turn, tokens in store.lazy_turns()])
+        print(f"✅ Resumed session '{store.data_path}' with {len(store)} turns.")
+        first_shown = max(0, len(store) - 6)
+        for offset, line in enumerate(store.read_display_lines(first_shown, len(store))):
+            ui_queue.put(("history", (line, first_shown + offset)))
+    else:
+        print(f"✅ Started new session '{store.data_path}'.")
+    return store
+
+def log_conversation_turn(model_key, turns, user_input, reply):
     try:
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        clean_ai_response = strip_ssml_tags(raw_ai_response)
+        clean_ai_response = reply.plain_text
+        records = []
+        for role, text, tokens in turns:
+            record = {'ts': timestamp, 'role': role, 'model_key': model_key, 'tokens': round(tokens, 1), 'text': text}
+            if role == 'model':
+                record['display'] = clean_ai_response
+            records.append(record)
         log_entry = (
             f"--- [ {timestamp} | Model: {model_key.upper()} ] ---\n"
             f"User: {user_input}\n"
             f"Diane (Clean): {clean_ai_response}\n"
-            f"Diane (SSML): {raw_ai_response}\n\n"
+            f"Diane (SSML): {reply.ssml}\n\n"
         )
-        with open(filename, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
-        print(f"📝 Logged to '{filename}'")
+        first_index = session_store.append_turns(records, log_entry)
+        print(f"📝 Logged to '{session_store.data_path}'")
+        return first_index
     except Exception as e:
         print(f"⚠️ Log Error: {e}")
+        return None
 
-def main_logic(backend_queue, ui_queue_ref):
-    global config, clients, audio_player, ui_queue
-    ui_queue = ui_queue_ref
-    load_dotenv()
-    set_high_priority()
-    config = load_configuration()
-    if not config:
-        ui_queue.put(("status", "FATAL: Config error. Check console."))
-        return
-    clients = setup_clients()
-    if not all(clients):
-        ui_queue.put(("status", "FATAL: Client setup error. Check console."))
-        return
+async def handle_history_page(request):
+    count = request.get('count', 40)
+    total = len(session_store)
+    if request['direction'] == 'older':
+        end = min(request['before'], total)
+        start = max(0, end - count)
+    elif request['direction'] == 'newer':
+        start = request['after']
+        end = min(start + count, total)
+    else:
+        end = total
+        start = max(0, end - count)
+    try:
+        lines = await asyncio.to_thread(session_store.read_display_lines, start, end)
+    except Exception as e:
+        print(f"⚠️ Could not page history from '{session_store.data_path}': {e}")
+        lines = []
+    end = start + len(lines)
+    ui_queue.put(("history_page", {'direction': request['direction'], 'start': start, 'end': end, 'lines': lines, 'at_end': end >= total}))
 
+class LoopCommandQueue:
+    def __init__(self):
+        self.lock = Lock()
+        self.loop = None
+        self.queue = None
+        self.early_items = []
+
+    def attach(self, loop):
+        with self.lock:
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            for entry in self.early_items:
+                self.queue.put_nowait(entry)
+            self.early_items.clear()
+
+    def put(self, item):
+        entry = (item, time.perf_counter())
+        with self.lock:
+            if self.loop is None:
+                self.early_items.append(entry)
+                return
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, entry)
+
+    async def get(self):
+        return await self.queue.get()
+
+def main_logic(backend_queue, ui_queue_ref, gui_shown_at=None):
+    try:
+        asyncio.run(_async_main(backend_queue, ui_queue_ref, gui_shown_at))
+    except KeyboardInterrupt:
+        print("--- Exiting due to Ctrl+C ---")
+
+async def start_runtime(loaded_config, active_backend, ui_queue_ref, profile=None, extra_phases=()):
+    global config, clients, backend, audio_player, tts_pipeline, tts_cache, cache_manager, session_store, ui_queue, stop_listening_event, tracer, prewarm_task, connections, speculator, router, summarizer, deadlines
+    config, backend, ui_queue = loaded_config, active_backend, ui_queue_ref
+    deadlines = dict(DEFAULT_DEADLINES, **config.get('deadlines', {}))
+    profile = profile or StartupProfile()
+    loop = asyncio.get_running_loop()
+    stop_listening_event = asyncio.Event()
+
+    gui_settings = config.get('gui', {})
+    ui_queue.put(("history_settings", {'max_turns': gui_settings.get('history_max_turns', 200), 'page_turns': gui_settings.get('history_page_turns', 40)}))
     os.makedirs("logs", exist_ok=True)
     config['log_filename'] = os.path.join("logs", f"conversation_log_{time.strftime('%Y-%m-%d_%H-%M-%S')}.txt")
-    audio_player = AudioPlayer()
-    audio_player.start()
+    tracing_settings = config.get('tracing', {})
+    tracer = LatencyTracer(tracing_settings.get('directory', "logs"), tracing_settings.get('enabled', True), tracing_settings.get('jsonl_max_bytes', 5 * 1024 * 1024), tracing_settings.get('summary_window', 500))
+    cache_settings = config.get('tts_cache', {})
+    phases = [
+        profile.run('clients', connect_clients(active_backend)),
+        profile.run('audio_device', asyncio.to_thread(prepare_audio_device, active_backend, config['audio_settings'])),
+        profile.run('session_store', asyncio.to_thread(open_session_store, config)),
+    ]
+    if cache_settings.get('enabled', True):
+        phases.append(profile.run('tts_cache', asyncio.to_thread(TTSAudioCache, cache_settings.get('directory', os.path.join("cache", "tts")), cache_settings.get('max_memory_bytes', 32 * 1024 * 1024), cache_settings.get('max_disk_bytes', 256 * 1024 * 1024))))
+    phases += [profile.run(name, job) for name, job in extra_phases]
+    results = await asyncio.gather(*phases)
+    clients, audio_interface, session_store = results[:3]
+    tts_cache = results[3] if cache_settings.get('enabled', True) else None
+    if not all(clients) or audio_interface is None:
+        return False
+
+    connections = ConnectionManager(backend, clients, config['models'], config['system_instruction'], config.get('connections', {}))
+    connections.start()
+    speculator = SpeculativeDispatcher(config.get('speculation', {}), _prefetch_reply, master_history.estimate)
+    router = HedgedRouter(config.get('router', {}), config['models'])
+    audio_player = AudioPlayer(loop, audio_interface, config['audio_settings'].get('playback_frames_per_buffer', 256))
+    tts_pipeline = SpeechSynthesisPipeline(clients[0], config)
+    cache_manager = ContextCacheManager(config['models'], config['system_instruction'], master_history, (MINIMUM_CACHE_TOKENS, CACHE_COMPACTION_THRESHOLD, DIFF_TOKEN_REBUILD_THRESHOLD), config.get('context_cache', {}), backend.create_cache)
+    cache_manager.start()
+    summary_settings = config.get('summarization', {})
+    summarizer = HistorySummarizer(master_history, (summary_settings.get('trigger_tokens', SUMMARY_TRIGGER_TOKENS), summary_settings.get('keep_recent_turns', SUMMARY_KEEP_RECENT_TURNS)), summary_settings, _summarize_history, cache_manager.notify_history_changed)
+    if summarizer.enabled and summarizer.model_key not in config['models']:
+        print(f"⚠️  Summary model '{summarizer.model_key}' is not in config['models']. History summarization is disabled.")
+        summarizer.enabled = False
+    summarizer.maybe_start()
+    if tts_cache:
+        prewarm_task = asyncio.create_task(prewarm_tts_cache([sanitize_ssml(BRAIN_ERROR_SSML)], clients[0], config['audio_settings']))
+    return True
+
+def start_greeting():
+    global greeting_active
+    greeting_ssml = """<speak>Hello world. <prosody rate="fast">Diane here!</prosody><break time="400ms"/> <prosody pitch="+5st">Oh, hey... I'm awake.</prosody><break time="400ms"/> <prosody rate="x-slow" pitch="-4st">How...</prosody><break time="200ms"/> <prosody rate="slow" pitch="-9st">wonderful.</prosody></speak>"""
+    greeting = parse_ssml(greeting_ssml)
 
-    def on_send_hotkey():
-        if app_state == 'listening':
-            backend_queue.put(('stop_listening', None))
-        elif app_state == 'awaiting_text':
-            ui_queue.put(('request_gui_input', None))
+    greeting_index = None
+    if len(master_history) == 0:
+        _, turn_tokens = master_history.append((make_turn('model', greeting.ssml), None, None))
+        greeting_index = log_conversation_turn("SYSTEM", [('model', greeting.ssml, turn_tokens[0])], "[STARTUP]", greeting)
+    else:
+        log_conversation_turn("SYSTEM", [], "[RESUMED]", greeting)
 
-    keyboard.add_hotkey('ctrl+shift+m', on_send_hotkey)
-    keyboard.add_hotkey('ctrl+alt+m', on_send_hotkey)
-    keyboard.add_hotkey('ctrl+shift+k', lambda: backend_queue.put(('cancel_action', None)))
-    keyboard.add_hotkey('ctrl+alt+k', lambda: backend_queue.put(('cancel_action', None)))
-    keyboard.add_hotkey('ctrl+shift+i', lambda: backend_queue.put(('toggle_pause_audio', None)))
-    keyboard.add_hotkey('ctrl+alt+i', lambda: backend_queue.put(('toggle_pause_audio', None)))
-    for model, key in [('l', 'lite'), ('o', 'flash'), ('p', 'pro')]:
-        keyboard.add_hotkey(f'ctrl+alt+{model}', lambda k=key: backend_queue.put(('start_voice', k)))
-        keyboard.add_hotkey(f'ctrl+shift+{model}', lambda k=key: backend_queue.put(('start_text', k)))
-    print("--- Hotkey listener is active ---")
+    print(f"\n[Diane]: {greeting.ssml}")
+    ui_queue.put(("history", (f"Diane: {greeting.plain_text}", greeting_index)))
+    begin_turn_trace('greeting', None)
+    greeting_active = True
+    set_application_state("processing", "🔊 Preparing greeting...")
+    start_turn(speak_ssml(greeting.ssml))
 
-    greeting_ssml = """<speak>Hello world. <prosody rate="fast">Diane here!</prosody><break time="400ms"/> <prosody pitch="+5st">Oh, hey... I'm awake.</prosody><break time="400ms"/> <prosody rate="x-slow" pitch="-4st">How...</prosody><break time="200ms"/> <prosody rate="slow" pitch="-9st">wonderful.</prosody></speak>"""
-    sanitized_greeting = sanitize_ssml(greeting_ssml)
-    clean_greeting_text = strip_ssml_tags(sanitized_greeting)
-
-    with history_lock:
-        master_history.append({'role': 'model', 'parts': [{'text': sanitized_greeting}]})
-
-    print(f"\n[Diane]: {sanitized_greeting}")
-    log_conversation_turn(config['log_filename'], "SYSTEM", "[STARTUP]", sanitized_greeting)
-    ui_queue.put(("history", f"Diane: {clean_greeting_text}"))
-    audio_files = create_audio_chunks(sanitized_greeting, clients[0], config)
-    if audio_files:
-        set_application_state("speaking")
-        audio_player.play_files(audio_files)
-    else:
-        set_application_state("idle")
+async def _async_main(backend_queue, ui_queue_ref, gui_shown_at=None):
+    global ui_queue, history_page_task
+    ui_queue = ui_queue_ref
+    backend_queue.attach(asyncio.get_running_loop())
+    profile = StartupProfile(STARTED_AT)
+    profile.mark('modules_imported', IMPORTED_AT)
+    if gui_shown_at is not None:
+        profile.mark('gui_shown', gui_shown_at)
+    set_application_state("starting", "⏳ Starting up...")
+    with profile.phase('config'):
+        load_dotenv()
+        set_high_priority()
+        loaded_config = load_configuration()
+    if not loaded_config:
+        ui_queue_ref.put(("status", "FATAL: Config error. Check console."))
+        return
+    hotkeys = ('hotkeys', asyncio.to_thread(register_hotkeys, backend_queue))
+    if not await start_runtime(loaded_config, create_backend(loaded_config.get('backend', {})), ui_queue_ref, profile, [hotkeys]):
+        ui_queue_ref.put(("status", "FATAL: Client setup error. Check console."))
+        return
+
+    profile.mark('ready')
+    profile.report()
+    set_application_state("idle", f"✅ Ready in {profile.marks['ready'] / 1000:.2f} s. Choose an input method.")
+    start_greeting()
 
     while True:
-        try:
-            command, data = backend_queue.get()
-            if command == 'start_voice':
-                handle_start_voice(data)
-            elif command == 'start_text':
-                handle_start_text(data)
-            elif command == 'stop_listening':
-                handle_stop_listening()
-            elif command == 'send_request':
-                handle_send_request(data, "awaiting_text")
-            elif command == 'cancel_action':
-                handle_cancel_action()
-            elif command == 'toggle_pause_audio':
-                audio_player.toggle_pause()
-        except KeyboardInterrupt:
-            print("--- Exiting due to Ctrl+C ---")
-            break
+        (command, data), received_at = await backend_queue.get()
+        if command == 'start_voice':
+            handle_start_voice(data, received_at)
+        elif command == 'start_text':
+            handle_start_text(data)
+        elif command == 'stop_listening':
+            handle_stop_listening()
+        elif command == 'send_request':
+            handle_send_request(data, "awaiting_text", received_at)
+        elif command == 'cancel_action':
+            handle_cancel_action(received_at)
+        elif command == 'toggle_pause_audio':
+            audio_player.toggle_pause()
+        elif command == 'load_history_page':
+            history_page_task = asyncio.create_task(handle_history_page(data))
+
+IMPORTED_AT = time.perf_counter()
 
 if __name__ == '__main__':
-    backend_queue, ui_queue = Queue(), Queue()
+    backend_queue, ui_queue = LoopCommandQueue(), UIUpdateQueue()
     root = tk.Tk()
     gui = DianeGUI(root, backend_queue, ui_queue)
-    logic_thread = threading.Thread(target=main_logic, args=(backend_queue, ui_queue), daemon=True)
+    root.update_idletasks()
+    logic_thread = threading.Thread(target=main_logic, args=(backend_queue, ui_queue, time.perf_counter()), daemon=True)
     logic_thread.start()
 
     try:
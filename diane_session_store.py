@@ -0,0 +1,224 @@
+# diane_session_store.py
+import os
+import json
+import mmap
+import glob
+import time
+import struct
+import atexit
+import threading
+from queue import Queue, Empty
+
+INDEX_ENTRY = struct.Struct('<QIfB3x')
+ROLE_CODES = {'user': 0, 'model': 1}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+class LazyTurn:
+    __slots__ = ('store', 'index', 'role', '_turn')
+
+    def __init__(self, store, index, role):
+        self.store = store
+        self.index = index
+        self.role = role
+        self._turn = None
+
+    def materialize(self):
+        if self._turn is None:
+            record = self.store.read_record(self.index)
+            self._turn = {'role': record['role'], 'parts': [{'text': record['text']}]}
+        return self._turn
+
+    def __getitem__(self, key):
+        if key == 'role':
+            return self.role
+        return self.materialize()[key]
+
+    def get(self, key, default=None):
+        if key == 'role':
+            return self.role
+        return self.materialize().get(key, default)
+
+class SessionStore:
+    def __init__(self, data_path, fsync_interval=2.0, batch_interval=0.25, text_log_path=None):
+        self.data_path = data_path
+        self.index_path = os.path.splitext(data_path)[0] + ".idx"
+        self.fsync_interval = fsync_interval
+        self.batch_interval = batch_interval
+        self.text_log_path = text_log_path
+        self.entries = []
+        self.mapped = None
+        self.read_lock = threading.Lock()
+        self.write_queue = Queue()
+        self.closed = False
+        self._recover_index()
+        self.next_index = len(self.entries)
+        self.data_file = open(self.data_path, 'ab')
+        self.index_file = open(self.index_path, 'ab')
+        self.text_log_file = open(self.text_log_path, 'a', encoding='utf-8') if self.text_log_path else None
+        self.data_offset = self.data_file.tell()
+        self.last_fsync = time.monotonic()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True, name="SessionStoreWriter")
+        self.writer.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def open_session(cls, directory, resume=True, **kwargs):
+        os.makedirs(directory, exist_ok=True)
+        existing = sorted(glob.glob(os.path.join(directory, "session_*.jsonl")))
+        if resume and existing:
+            return cls(existing[-1], **kwargs)
+        return cls(os.path.join(directory, f"session_{time.strftime('%Y-%m-%d_%H-%M-%S')}.jsonl"), **kwargs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lazy_turns(self):
+        return [(LazyTurn(self, i, ROLE_NAMES[role]), tokens) for i, (_, _, tokens, role) in enumerate(self.entries)]
+
+    def read_record(self, index):
+        offset, length, _, _ = self.entries[index]
+        with self.read_lock:
+            if self.mapped is not None and offset + length <= len(self.mapped):
+                raw = self.mapped[offset:offset + length]
+            else:
+                with open(self.data_path, 'rb') as f:
+                    f.seek(offset)
+                    raw = f.read(length)
+        return json.loads(raw)
+
+    def read_records(self, start, end):
+        entries = self.entries[max(0, start):end]
+        if not entries:
+            return []
+        first, last = entries[0][0], entries[-1][0] + entries[-1][1]
+        with self.read_lock:
+            if self.mapped is not None and last <= len(self.mapped):
+                block = self.mapped[first:last]
+            else:
+                with open(self.data_path, 'rb') as f:
+                    f.seek(first)
+                    block = f.read(last - first)
+        return [json.loads(block[offset - first:offset - first + length]) for offset, length, _, _ in entries]
+
+    def read_display_lines(self, start, end):
+        lines = []
+        for record in self.read_records(start, end):
+            speaker = "You" if record['role'] == 'user' else "Diane"
+            lines.append(f"{speaker}: {record.get('display', record['text'])}")
+        return lines
+
+    def append_turns(self, records, text_log_entry=None):
+        first_index = self.next_index
+        self.next_index += len(records)
+        self.write_queue.put((records, text_log_entry))
+        return first_index
+
+    def close(self):
+        if self.closed:
+            return
+        self.write_queue.put(None)
+        self.writer.join(timeout=5)
+
+    def _recover_index(self):
+        if not os.path.exists(self.data_path):
+            open(self.data_path, 'wb').close()
+        data_size = os.path.getsize(self.data_path)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                raw_index = f.read()
+            usable = len(raw_index) - len(raw_index) % INDEX_ENTRY.size
+            for entry in INDEX_ENTRY.iter_unpack(raw_index[:usable]):
+                if entry[0] + entry[1] >= data_size:
+                    break
+                self.entries.append(entry)
+        if data_size:
+            with open(self.data_path, 'rb') as f:
+                self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        scan_from = self.entries[-1][0] + self.entries[-1][1] + 1 if self.entries else 0
+        valid_end = scan_from
+        recovered = []
+        while self.mapped is not None and scan_from < data_size:
+            line_end = self.mapped.find(b'\n', scan_from)
+            if line_end == -1:
+                break
+            try:
+                record = json.loads(self.mapped[scan_from:line_end])
+                recovered.append((scan_from, line_end - scan_from, float(record.get('tokens', 0)), ROLE_CODES[record['role']]))
+            except (ValueError, KeyError):
+                pass
+            scan_from = valid_end = line_end + 1
+        if valid_end < data_size:
+            print(f"⚠️  Session store: discarding {data_size - valid_end} bytes of incomplete trailing data.")
+            if self.mapped is not None:
+                self.mapped.close()
+                self.mapped = None
+            os.truncate(self.data_path, valid_end)
+            if valid_end:
+                with open(self.data_path, 'rb') as f:
+                    self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries.extend(recovered)
+        with open(self.index_path, 'wb') as f:
+            f.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in self.entries))
+
+    def _write_loop(self):
+        unsynced = False
+        while True:
+            try:
+                batch = [self.write_queue.get(timeout=self.fsync_interval)]
+            except Empty:
+                if unsynced:
+                    self._fsync()
+                    unsynced = False
+                continue
+            deadline = time.monotonic() + self.batch_interval
+            while batch[-1] is not None:
+                try:
+                    batch.append(self.write_queue.get(timeout=max(0, deadline - time.monotonic())))
+                except Empty:
+                    break
+            stopping = batch[-1] is None
+            unsynced = not self._write_batch([item for item in batch if item is not None], force_fsync=stopping)
+            if stopping:
+                self.closed = True
+                for f in (self.data_file, self.index_file, self.text_log_file):
+                    if f:
+                        f.close()
+                return
+
+    def _write_batch(self, batch, force_fsync=False):
+        data_chunks, index_chunks, text_chunks = [], [], []
+        new_entries = []
+        for records, text_log_entry in batch:
+            for record in records:
+                line = json.dumps(record, ensure_ascii=False).encode('utf-8')
+                entry = (self.data_offset, len(line), float(record.get('tokens', 0)), ROLE_CODES[record['role']])
+                data_chunks.append(line + b'\n')
+                index_chunks.append(INDEX_ENTRY.pack(*entry))
+                new_entries.append(entry)
+                self.data_offset += len(line) + 1
+            if text_log_entry:
+                text_chunks.append(text_log_entry)
+        try:
+            if data_chunks:
+                self.data_file.write(b''.join(data_chunks))
+                self.data_file.flush()
+                self.index_file.write(b''.join(index_chunks))
+                self.index_file.flush()
+                self.entries.extend(new_entries)
+            if text_chunks and self.text_log_file:
+                self.text_log_file.write(''.join(text_chunks))
+                self.text_log_file.flush()
+            if force_fsync or time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self._fsync()
+                return True
+        except OSError as e:
+            print(f"⚠️ Session store write error: {e}")
+        return False
+
+    def _fsync(self):
+        try:
+            os.fsync(self.data_file.fileno())
+            os.fsync(self.index_file.fileno())
+        except OSError as e:
+            print(f"⚠️ Session store fsync error: {e}")
+        self.last_fsync = time.monotonic()
@@ -0,0 +1,162 @@
+# diane_speculation.py
+import re
+import time
+import asyncio
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+DEFAULT_SPECULATION_SETTINGS = {
+    'enabled': False,
+    'stable_ms': 400,
+    'min_chars': 12,
+    'max_attempts': 3,
+}
+
+def normalize_transcript(text):
+    return " ".join(PUNCTUATION_RE.sub(" ", text.lower()).split())
+
+class Speculation:
+    def __init__(self, text, model_key):
+        self.text = text
+        self.key = normalize_transcript(text)
+        self.model_key = model_key
+        self.parts = []
+        self.usage = {}
+        self.prompt_tokens = 0
+        self.history_version = None
+        self.cached = False
+        self.error = None
+        self.done = False
+        self.started_at = time.perf_counter()
+        self.first_byte_at = None
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def push(self, text):
+        if self.first_byte_at is None:
+            self.first_byte_at = time.perf_counter()
+        self.parts.append(text)
+        self.changed.set()
+
+    def finish(self, error=None):
+        self.error = error
+        self.done = True
+        self.changed.set()
+
+    async def stream(self):
+        index = 0
+        while True:
+            if index < len(self.parts):
+                index += 1
+                yield self.parts[index - 1]
+            elif self.done:
+                return
+            else:
+                self.changed.clear()
+                await self.changed.wait()
+
+class SpeculativeDispatcher:
+    def __init__(self, settings, generate, estimate_tokens):
+        self.settings = dict(DEFAULT_SPECULATION_SETTINGS, **(settings or {}))
+        self.enabled = self.settings['enabled']
+        self.stable_seconds = self.settings['stable_ms'] / 1000
+        self.generate = generate
+        self.estimate_tokens = estimate_tokens
+        self.model_key = None
+        self.current = None
+        self.claimed = None
+        self.latest_text = ""
+        self.latest_key = ""
+        self.timer = None
+        self.attempts = 0
+        self.counts = {'voice_turns': 0, 'speculated_turns': 0, 'launched': 0, 'hits': 0, 'misses': 0, 'superseded': 0, 'abandoned': 0, 'failed': 0, 'wasted_prompt_tokens': 0, 'wasted_output_tokens': 0}
+
+    def begin(self, model_key):
+        self.end()
+        self.model_key = model_key
+        self.attempts = 0
+        self.latest_text, self.latest_key = "", ""
+        self.counts['voice_turns'] += 1
+
+    def observe(self, text):
+        if not self.enabled or self.model_key is None:
+            return
+        key = normalize_transcript(text)
+        if key == self.latest_key:
+            return
+        self.latest_text, self.latest_key = text, key
+        if self.timer:
+            self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(self.stable_seconds, self._on_stable)
+
+    def _on_stable(self):
+        self.timer = None
+        if len(self.latest_key) < self.settings['min_chars'] or self.attempts >= self.settings['max_attempts']:
+            return
+        if self.current is not None:
+            if self.current.key == self.latest_key:
+                return
+            self._discard(self.current, 'superseded')
+        self.attempts += 1
+        self.counts['launched'] += 1
+        speculation = self.current = Speculation(self.latest_text, self.model_key)
+        speculation.task = asyncio.create_task(self._run(speculation))
+        print(f"--- Speculating on stable transcript: \"{speculation.text}\" ---")
+
+    async def _run(self, speculation):
+        try:
+            await self.generate(speculation)
+            speculation.finish()
+        except asyncio.CancelledError:
+            speculation.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            speculation.finish(e)
+
+    def claim(self, final_text, history_version):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+        self.counts['speculated_turns'] += 1
+        if speculation.error is not None:
+            self._discard(speculation, 'failed')
+        elif speculation.key != normalize_transcript(final_text) or speculation.history_version not in (None, history_version):
+            self._discard(speculation, 'misses')
+        else:
+            self.counts['hits'] += 1
+            self.claimed = speculation
+            return speculation
+        print(f"--- Speculation discarded (final transcript differs). {self.summary()} ---")
+        return None
+
+    def end(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.current is not None:
+            self._discard(self.current, 'abandoned')
+            self.current = None
+        if self.claimed is not None and not self.claimed.done:
+            self.claimed.task.cancel()
+        self.claimed = None
+        self.model_key = None
+
+    def _discard(self, speculation, reason):
+        if not speculation.done:
+            speculation.task.cancel()
+        self.counts[reason] += 1
+        if speculation.history_version is None:
+            return
+        usage = speculation.usage
+        self.counts['wasted_prompt_tokens'] += int(usage.get('prompt_token_count') or speculation.prompt_tokens)
+        self.counts['wasted_output_tokens'] += int(usage.get('candidates_token_count') or self.estimate_tokens("".join(speculation.parts), speculation.model_key))
+
+    def stats(self):
+        speculated = self.counts['speculated_turns']
+        return dict(self.counts, hit_rate=round(self.counts['hits'] / speculated, 3) if speculated else 0.0)
+
+    def summary(self):
+        stats = self.stats()
+        return f"Speculation hit rate {stats['hits']}/{stats['speculated_turns']} ({stats['hit_rate']:.0%}), wasted {stats['wasted_prompt_tokens']} prompt + {stats['wasted_output_tokens']} output tokens."
@@ -0,0 +1,409 @@
+# diane_ssml.py
+import re
+import html
+import itertools
+from functools import lru_cache
+
+TAG_RE = re.compile(r'<\s*(/?)\s*([a-zA-Z][\w:.-]*)(.*?)(/?)\s*>\Z', re.DOTALL)
+ATTR_RE = re.compile(r'([a-zA-Z_:][\w:.-]*)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'>/=]+)')
+ENTITY_RE = re.compile(r'&(#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);')
+PARTIAL_ENTITY_RE = re.compile(r'&#?[xX]?[0-9a-zA-Z]{0,31}\Z')
+TAG_TOKEN_RE = re.compile(r'<(?:[a-zA-Z/?]|!(?!--))[^<>]*>')
+SENTENCE_END_RE = re.compile(r'[.!?]+(?=\s)')
+WORD_END_RE = re.compile(r'\S(?=\s)')
+SPEAKABLE_RE = re.compile(r'(?:^|>)\s*[^<\s]')
+
+XML_ENTITIES = ('amp', 'lt', 'gt', 'quot', 'apos')
+TAG_ALIASES = {'mods': 'prosody', 'songs': 'prosody'}
+DROPPED_TAGS = ('speak', 'emphasis')
+VOID_TAGS = ('break',)
+EXCLUSIVE_TAGS = ('prosody',)
+FENCE = '```'
+MAX_TAG_CHARS = 512
+
+def _attr_value(value):
+    if value[:1] in ('"', "'"):
+        value = value[1:-1]
+    return html.escape(html.unescape(value), quote=True)
+
+@lru_cache(maxsize=1024)
+def parse_tag(tag_text):
+    match = TAG_RE.match(tag_text)
+    if not match:
+        return None
+    is_closing, name, attr_text, self_closing = match.group(1) == '/', match.group(2).lower(), match.group(3), match.group(4) == '/'
+    name = TAG_ALIASES.get(name, name)
+    if name in DROPPED_TAGS or (is_closing and name in VOID_TAGS):
+        return None
+    if is_closing:
+        return 'close', name, f'</{name}>'
+    attrs = ''.join(f' {key.lower()}="{_attr_value(value)}"' for key, value in ATTR_RE.findall(attr_text))
+    if name in VOID_TAGS or self_closing:
+        return 'void', name, f'<{name}{attrs}/>'
+    return 'open', name, f'<{name}{attrs}>'
+
+class SplitPoint:
+    __slots__ = ('offset', 'plain_offset', 'open_tags', 'kind', 'piece', 'cut')
+
+    def __init__(self, offset, plain_offset, open_tags, kind, piece, cut=0):
+        self.offset = offset
+        self.plain_offset = plain_offset
+        self.open_tags = open_tags
+        self.kind = kind
+        self.piece = piece
+        self.cut = cut
+
+    def __repr__(self):
+        return f"SplitPoint({self.kind} @ {self.offset}B, depth {len(self.open_tags)})"
+
+def utf8_len(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+class SSMLTokenizer:
+    def __init__(self, word_boundaries=False):
+        self.word_boundaries = word_boundaries
+        self.boundary_re = WORD_END_RE if word_boundaries else SENTENCE_END_RE
+        self.word_kind = 'word' if word_boundaries else None
+        self.buffer = ""
+        self.pieces = ["<speak>"]
+        self.byte_length = len("<speak>")
+        self.plain_pieces = []
+        self.plain_length = 0
+        self.open_tags = ()
+        self.anchors = []
+        self.pending_space = ""
+        self.started = False
+        self.plain_started = False
+        self.skip_space = False
+        self.pending_boundary = None
+        self.closed = False
+        self._ssml = None
+
+    def feed(self, text):
+        if self.closed:
+            raise ValueError("Cannot feed a closed SSMLTokenizer.")
+        self.buffer += text
+        self._scan(final=False)
+        return self
+
+    def close(self, text=""):
+        if not self.closed:
+            self.buffer += text
+            self._scan(final=True)
+            self.pending_space = ""
+            self._close_to(0)
+            self.pieces.append("</speak>")
+            self.byte_length += len("</speak>")
+            self.closed = True
+        return self
+
+    @property
+    def ssml(self):
+        if self._ssml is None or not self.closed:
+            self._ssml = ''.join(self.pieces)
+        return self._ssml
+
+    @property
+    def plain_text(self):
+        return ''.join(self.plain_pieces).rstrip()
+
+    def slice(self, start=None, end=None):
+        first, first_cut = (start.piece, start.cut) if start else (1, 0)
+        last, last_cut = (end.piece, end.cut) if end else (len(self.pieces) - (1 if self.closed else 0), 0)
+        if first == last:
+            return self.pieces[first][first_cut:last_cut] if last_cut else ""
+        parts = self.pieces[first:last]
+        if first_cut:
+            parts[0] = parts[0][first_cut:]
+        if last_cut:
+            parts.append(self.pieces[last][:last_cut])
+        return ''.join(parts)
+
+    def split_points(self, first_anchor=0):
+        for index in range(first_anchor, len(self.anchors)):
+            piece, offset, plain_offset, lead, open_tags = self.anchors[index]
+            if lead.__class__ is str:
+                yield SplitPoint(offset, plain_offset, open_tags, lead, piece)
+                continue
+            body = self.pieces[piece]
+            ascii_body, last_cut = body.isascii(), 0
+            for match in self.boundary_re.finditer(body):
+                cut = match.end()
+                offset += cut - last_cut if ascii_body else utf8_len(body[last_cut:cut])
+                last_cut = cut
+                yield SplitPoint(offset, plain_offset + cut - lead, open_tags, self._boundary_kind(body[cut - 1]), piece, cut)
+
+    def _scan(self, final):
+        buf, pos, end = self.buffer, 0, len(self.buffer)
+        next_tag = next_entity = next_fence = -1
+        while pos < end:
+            if next_tag < pos:
+                next_tag = buf.find('<', pos) % (end + 1)
+            if next_entity < pos:
+                next_entity = buf.find('&', pos) % (end + 1)
+            if next_fence < pos:
+                next_fence = buf.find('`', pos) % (end + 1)
+            next_pos = min(next_tag, next_entity, next_fence)
+            if next_pos > pos:
+                self._run(buf[pos:next_pos])
+                pos = next_pos
+                if pos == end:
+                    break
+            char = buf[pos]
+            if char == '<':
+                match = TAG_TOKEN_RE.match(buf, pos)
+                if match is not None:
+                    self._handle_tag(match.group())
+                    next_pos = match.end()
+                else:
+                    next_pos = self._scan_tag(buf, pos, final)
+            elif char == '&':
+                next_pos = self._scan_entity(buf, pos, final)
+            else:
+                next_pos = self._scan_fence(buf, pos, final)
+            if next_pos is None:
+                break
+            pos = next_pos
+        self.buffer = buf[pos:]
+
+    def _scan_tag(self, buf, pos, final):
+        if buf.startswith('<!--', pos):
+            comment_end = buf.find('-->', pos + 4)
+            if comment_end == -1:
+                return len(buf) if final else None
+            return comment_end + 3
+        if pos + 1 >= len(buf) or (buf.startswith('<!', pos) and len(buf) - pos < 4 and '<!--'.startswith(buf[pos:])):
+            if not final:
+                return None
+        elif buf[pos + 1].isalpha() or buf[pos + 1] in '/!?':
+            tag_end = buf.find('>', pos + 1)
+            if tag_end != -1 and buf.find('<', pos + 1, tag_end) == -1:
+                self._handle_tag(buf[pos:tag_end + 1])
+                return tag_end + 1
+            if tag_end == -1 and buf.find('<', pos + 1) == -1 and not final and len(buf) - pos < MAX_TAG_CHARS:
+                return None
+        self._text('&lt;', '<')
+        return pos + 1
+
+    def _scan_entity(self, buf, pos, final):
+        match = ENTITY_RE.match(buf, pos)
+        if match is None:
+            if not final and PARTIAL_ENTITY_RE.match(buf, pos):
+                return None
+            self._text('&amp;', '&')
+            return pos + 1
+        entity = match.group()
+        plain = html.unescape(entity)
+        if match.group(1)[0] == '#' or match.group(1) in XML_ENTITIES:
+            self._text(entity, plain)
+        elif plain != entity:
+            self._text(html.escape(plain, quote=False), plain)
+        else:
+            self._text('&amp;', '&')
+            return pos + 1
+        return match.end()
+
+    def _scan_fence(self, buf, pos, final):
+        rest = buf[pos:pos + 6]
+        if not final and len(rest) < 6 and (FENCE + 'xml').startswith(rest):
+            return None
+        if not buf.startswith(FENCE, pos):
+            self._text('`')
+            return pos + 1
+        if buf.startswith('xml', pos + 3):
+            self.skip_space = True
+            return pos + 6
+        return pos + 3
+
+    def _handle_tag(self, tag_text):
+        parsed = parse_tag(tag_text)
+        if parsed is None:
+            return
+        kind, name, markup = parsed
+        if kind == 'close':
+            self._close_named(name)
+        elif kind == 'void':
+            self._markup(markup)
+        else:
+            if name in EXCLUSIVE_TAGS:
+                self._close_named(name)
+            self._markup(markup)
+            self.open_tags += ((name, markup),)
+
+    def _close_named(self, name):
+        for depth in range(len(self.open_tags) - 1, -1, -1):
+            if self.open_tags[depth][0] == name:
+                self._close_to(depth)
+                if not self.open_tags:
+                    self._mark('element')
+                return
+
+    def _close_to(self, depth):
+        while len(self.open_tags) > depth:
+            name = self.open_tags[-1][0]
+            self.open_tags = self.open_tags[:-1]
+            self._markup(f'</{name}>')
+
+    def _run(self, run):
+        if not self.started or self.skip_space:
+            run = run.lstrip()
+            if not run:
+                return
+        elif self.pending_boundary and run[0].isspace():
+            self._mark(self.pending_boundary)
+        body = run.rstrip()
+        if not body:
+            self.pending_space += run
+            return
+        if self.pending_space:
+            self._flush_space()
+        lead = 0 if self.plain_started else len(body) - len(body.lstrip())
+        self.anchors.append((len(self.pieces), self.byte_length, self.plain_length, lead, self.open_tags))
+        self.started = True
+        self.skip_space = False
+        self.pieces.append(body)
+        self.byte_length += len(body) if body.isascii() else len(body.encode('utf-8'))
+        self.plain_started = True
+        self.plain_pieces.append(body[lead:] if lead else body)
+        self.plain_length += len(body) - lead
+        kind = 'sentence' if body[-1] in '.!?' else self.word_kind
+        if kind and len(body) < len(run):
+            self.pending_boundary = None
+            self._mark(kind)
+        else:
+            self.pending_boundary = kind
+        self.pending_space += run[len(body):]
+
+    def _boundary_kind(self, last_char):
+        return 'sentence' if last_char in '.!?' else self.word_kind
+
+    def _flush_space(self):
+        space, self.pending_space = self.pending_space, ""
+        self.pieces.append(space)
+        self.byte_length += utf8_len(space)
+        if self.plain_started:
+            self.plain_pieces.append(space)
+            self.plain_length += len(space)
+
+    def _text(self, text, plain=None):
+        self._markup(text)
+        self._plain(text if plain is None else plain)
+
+    def _markup(self, text):
+        if self.pending_space:
+            self._flush_space()
+        self.started = True
+        self.skip_space = False
+        self.pending_boundary = None
+        self.pieces.append(text)
+        self.byte_length += len(text) if text.isascii() else len(text.encode('utf-8'))
+
+    def _plain(self, text):
+        if not self.plain_started:
+            text = text.lstrip()
+            if not text:
+                return
+            self.plain_started = True
+        self.plain_pieces.append(text)
+        self.plain_length += len(text)
+
+    def _mark(self, kind):
+        if self.anchors and self.anchors[-1][0] == len(self.pieces):
+            return
+        self.anchors.append((len(self.pieces), self.byte_length, self.plain_length, kind, self.open_tags))
+
+def parse_ssml(raw_text):
+    return SSMLTokenizer().close(raw_text)
+
+def sanitize_ssml(raw_text):
+    return parse_ssml(raw_text).ssml
+
+def strip_ssml_tags(ssml_text):
+    return parse_ssml(ssml_text).plain_text
+
+def has_speakable_text(ssml_text):
+    return SPEAKABLE_RE.search(ssml_text) is not None
+
+def opening_tags(open_tags):
+    return ''.join(open_text for _, open_text in open_tags)
+
+def closing_tags(open_tags):
+    return ''.join(f'</{name}>' for name, _ in reversed(open_tags))
+
+class SSMLStreamSegmenter:
+    def __init__(self, min_segment_chars=60):
+        self.min_segment_chars = min_segment_chars
+        self.tokenizer = SSMLTokenizer()
+        self.last_cut = None
+        self.next_anchor = 0
+
+    def feed(self, text):
+        self.tokenizer.feed(text)
+        segments = []
+        for point in self.tokenizer.split_points(self.next_anchor):
+            cut_plain = self.last_cut.plain_offset if self.last_cut else 0
+            if point.plain_offset - cut_plain >= self.min_segment_chars:
+                self._cut(point, segments)
+        self.next_anchor = len(self.tokenizer.anchors)
+        return segments
+
+    def flush(self):
+        self.tokenizer.close()
+        segments = []
+        self._cut(None, segments)
+        return segments
+
+    def _cut(self, point, segments):
+        start = self.last_cut
+        body = self.tokenizer.slice(start, point)
+        self.last_cut = point
+        if not has_speakable_text(body):
+            return
+        segments.append("<speak>" + opening_tags(start.open_tags if start else ()) + body + closing_tags(point.open_tags if point else ()) + "</speak>")
+
+def split_ssml(ssml_text, byte_limit, first_chunk_limit=None, word_boundaries=False):
+    document = SSMLTokenizer(word_boundaries).close(ssml_text)
+    return split_document(document, byte_limit, min(first_chunk_limit or byte_limit, byte_limit))
+
+def split_document(document, byte_limit, first_chunk_limit=None):
+    chunks = []
+    wrapper_bytes = len("<speak></speak>")
+    body_end = SplitPoint(document.byte_length - len("</speak>"), document.plain_length, (), 'end', len(document.pieces) - 1)
+    if document.byte_length <= (first_chunk_limit or byte_limit):
+        return [document.ssml] if has_speakable_text(document.slice(None, body_end)) else []
+    points = itertools.chain(document.split_points(), (body_end,))
+
+    def tag_bytes(point, tags):
+        return len(tags(point.open_tags).encode('utf-8')) if point is not None else 0
+
+    def emit(start, end):
+        body = document.slice(start, end)
+        if has_speakable_text(body):
+            chunks.append("<speak>" + opening_tags(start.open_tags if start else ()) + body + closing_tags(end.open_tags) + "</speak>")
+
+    start, start_offset, start_bytes = None, len("<speak>"), 0
+    best, point = None, next(points)
+    while point is not None:
+        limit = byte_limit if chunks else (first_chunk_limit or byte_limit)
+        size = wrapper_bytes + start_bytes + (point.offset - start_offset) + tag_bytes(point, closing_tags)
+        if size <= limit:
+            best, point = point, next(points, None)
+            continue
+        if best is None:
+            fragment = document.slice(start, point)
+            if document.word_boundaries or not has_speakable_text(fragment):
+                emit(start, point)
+            else:
+                print(f"--- SSML span of {size} bytes has no sentence break under {limit} bytes. Splitting at word boundaries... ---")
+                fragment = opening_tags(start.open_tags if start else ()) + fragment + closing_tags(point.open_tags)
+                chunks += split_ssml(fragment, byte_limit, limit, word_boundaries=True)
+            best, point = point, next(points, None)
+        else:
+            emit(start, best)
+        start, start_offset, start_bytes = best, best.offset, tag_bytes(best, opening_tags)
+        best = None
+        if point is not None and wrapper_bytes + start_bytes + (body_end.offset - start_offset) <= (byte_limit if chunks else (first_chunk_limit or byte_limit)):
+            best, point = body_end, None
+    if best is not None:
+        emit(start, best)
+    return chunks
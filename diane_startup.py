@@ -0,0 +1,56 @@
+# diane_startup.py
+import time
+import importlib
+from contextlib import contextmanager
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+def preload_modules(*modules):
+    for module in modules:
+        module.load()
+
+class StartupProfile:
+    def __init__(self, started_at=None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.phases = {}
+        self.marks = {}
+
+    def _ms(self, at):
+        return (at - self.started_at) * 1000
+
+    def mark(self, name, at=None):
+        self.marks[name] = self._ms(time.perf_counter() if at is None else at)
+
+    @contextmanager
+    def phase(self, name):
+        started, ok = time.perf_counter(), False
+        try:
+            yield
+            ok = True
+        finally:
+            self.phases[name] = {'start_ms': self._ms(started), 'duration_ms': (time.perf_counter() - started) * 1000, 'ok': ok}
+
+    async def run(self, name, awaitable):
+        with self.phase(name):
+            return await awaitable
+
+    def as_dict(self):
+        return {'phases': {name: {key: round(value, 1) if isinstance(value, float) else value for key, value in phase.items()} for name, phase in self.phases.items()}, 'marks': {name: round(at, 1) for name, at in self.marks.items()}}
+
+    def report(self):
+        print(f"--- Startup profile ({self.marks.get('ready', self._ms(time.perf_counter())):.0f} ms to ready) ---")
+        rows = [(phase['start_ms'], f"    {name:<16} +{phase['start_ms']:>6.0f} ms  {phase['duration_ms']:>6.0f} ms" + ("" if phase['ok'] else "  FAILED")) for name, phase in self.phases.items()]
+        rows += [(at, f"    {name:<16} @{at:>6.0f} ms") for name, at in self.marks.items()]
+        for _, line in sorted(rows):
+            print(line)
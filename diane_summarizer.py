@@ -0,0 +1,71 @@
+# diane_summarizer.py
+import time
+import asyncio
+from diane_history import make_turn
+
+SUMMARY_INSTRUCTION = "You maintain the running memory of a long spoken conversation between a user and an assistant named Diane. Write plain prose with no SSML, markup or lists."
+SUMMARY_REQUEST = "Fold everything above into one updated summary of the conversation so far, including any earlier summary. Keep names, facts, decisions, open questions and the user's stated preferences. Drop small talk. Write it from Diane's point of view in under 300 words."
+SUMMARY_PREFIX = "[Summary of our earlier conversation] "
+
+class HistorySummarizer:
+    def __init__(self, history, thresholds, settings=None, generate=None, on_folded=None):
+        settings = settings or {}
+        self.history = history
+        self.trigger_tokens, self.keep_turns = thresholds
+        self.enabled = settings.get('enabled', True)
+        self.model_key = settings.get('model', 'lite')
+        self.generate = generate
+        self.on_folded = on_folded
+        self.task = None
+        self.counts = {'runs': 0, 'failures': 0, 'stale': 0, 'folded_turns': 0, 'tokens_before': 0, 'tokens_after': 0, 'last_seconds': 0.0}
+
+    def maybe_start(self):
+        if not self.enabled or (self.task is not None and not self.task.done()):
+            return None
+        snapshot = self.history.snapshot()
+        if snapshot.total_tokens() < self.trigger_tokens:
+            return None
+        end = self._fold_end(snapshot)
+        if end < (2 if snapshot.folded else 1):
+            return None
+        self.task = asyncio.create_task(self._run(snapshot, end))
+        return self.task
+
+    def _fold_end(self, snapshot):
+        end = min(len(snapshot) - self.keep_turns, len(snapshot) - 1)
+        while end > 0 and snapshot[end]['role'] != 'user':
+            end -= 1
+        return end
+
+    async def _run(self, snapshot, end):
+        started = time.perf_counter()
+        print(f"--- HISTORY SUMMARY: Folding {end} of {len(snapshot)} turns ({int(snapshot.range_tokens(0, end))} tokens) into a summary with '{self.model_key.upper()}' in the background... ---")
+        try:
+            text = await self.generate(self.model_key, SUMMARY_INSTRUCTION, snapshot.turns(0, end) + [make_turn('user', SUMMARY_REQUEST)])
+            if not text or not text.strip():
+                raise ValueError("empty summary")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.counts['failures'] += 1
+            print(f"⚠️  History summary failed: {e}")
+            return
+        tokens_before = snapshot.total_tokens()
+        version = self.history.fold(snapshot, end, make_turn('model', SUMMARY_PREFIX + text.strip()))
+        if version is None:
+            self.counts['stale'] += 1
+            print("⚠️  History changed shape while summarizing. Discarding the summary.")
+            return
+        tokens_after = self.history.snapshot().total_tokens()
+        self.counts['runs'] += 1
+        self.counts['folded_turns'] += end
+        self.counts['tokens_before'] += int(tokens_before)
+        self.counts['tokens_after'] += int(tokens_after)
+        self.counts['last_seconds'] = round(time.perf_counter() - started, 3)
+        print(f"✅ History summarized in {self.counts['last_seconds']:.2f}s: {int(tokens_before)} -> {int(tokens_after)} tokens, {self.history.snapshot().folded} raw turns folded (history v{version}).")
+        if self.on_folded:
+            self.on_folded()
+
+    def stats(self):
+        snapshot = self.history.snapshot()
+        return dict(self.counts, live_turns=len(snapshot), folded_raw_turns=snapshot.folded, live_tokens=int(snapshot.total_tokens()))
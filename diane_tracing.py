@@ -0,0 +1,162 @@
+# diane_tracing.py
+import os
+import json
+import time
+import threading
+from queue import Queue
+from collections import deque
+
+STAGE_INTERVALS = (
+    ('mic_open', 'received', 'listening_start'),
+    ('first_interim', 'listening_start', 'stt_first_interim'),
+    ('transcript_tail', 'listening_stop', 'stt_done'),
+    ('llm_first_byte', 'llm_request', 'llm_first_byte'),
+    ('llm_total', 'llm_request', 'llm_complete'),
+    ('tts_first_chunk', 'tts_first_request', 'tts_first_response'),
+    ('llm_to_first_audio', 'llm_request', 'first_audio'),
+    ('end_to_first_audio', 'received', 'first_audio'),
+    ('cancel_to_idle', 'cancel_requested', 'cancel_idle'),
+)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+class TurnTrace:
+    def __init__(self, turn_id, kind, model_key, received_at=None):
+        self.turn_id = turn_id
+        self.kind = kind
+        self.model_key = model_key
+        self.origin = received_at if received_at is not None else time.perf_counter()
+        self.wall_start = time.time() - (time.perf_counter() - self.origin)
+        self.marks = {'received': 0.0}
+        self.attrs = {}
+        self.spans = []
+        self.finished = False
+
+    def mark(self, name, at=None, overwrite=False):
+        if overwrite or name not in self.marks:
+            self.marks[name] = round(((at if at is not None else time.perf_counter()) - self.origin) * 1000, 2)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, name, amount):
+        self.attrs[name] = self.attrs.get(name, 0) + amount
+
+    def start_span(self, name, **attrs):
+        span = {'name': name, 'start_ms': round((time.perf_counter() - self.origin) * 1000, 2)}
+        span.update(attrs)
+        self.spans.append(span)
+        return span
+
+    def end_span(self, span, **attrs):
+        span['end_ms'] = round((time.perf_counter() - self.origin) * 1000, 2)
+        span.update(attrs)
+
+    def intervals(self):
+        return {name: round(self.marks[end] - self.marks[start], 2) for name, start, end in STAGE_INTERVALS if start in self.marks and end in self.marks}
+
+    def to_record(self, status):
+        return {
+            'turn_id': self.turn_id,
+            'ts': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.wall_start)),
+            'kind': self.kind,
+            'model_key': self.model_key,
+            'status': status,
+            'marks_ms': dict(self.marks),
+            'intervals_ms': self.intervals(),
+            'attrs': dict(self.attrs),
+            'spans': [dict(span) for span in self.spans],
+        }
+
+class LatencyTracer:
+    def __init__(self, directory="logs", enabled=True, jsonl_max_bytes=5 * 1024 * 1024, summary_window=500):
+        self.enabled = enabled
+        self.jsonl_path = os.path.join(directory, "latency_traces.jsonl")
+        self.prometheus_path = os.path.join(directory, "latency_metrics.prom")
+        self.jsonl_max_bytes = jsonl_max_bytes
+        self.lock = threading.Lock()
+        self.next_turn_id = 1
+        self.windows = {name: deque(maxlen=summary_window) for name, _, _ in STAGE_INTERVALS}
+        self.totals = {name: [0, 0.0] for name, _, _ in STAGE_INTERVALS}
+        self.status_counts = {}
+        self.path_counts = {}
+        self.export_queue = Queue()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            threading.Thread(target=self._export_loop, daemon=True, name="LatencyExporter").start()
+
+    def begin_turn(self, kind, model_key=None, received_at=None):
+        with self.lock:
+            turn_id = self.next_turn_id
+            self.next_turn_id += 1
+        return TurnTrace(turn_id, kind, model_key, received_at)
+
+    def finish(self, trace, status):
+        if trace.finished:
+            return None
+        trace.finished = True
+        record = trace.to_record(status)
+        with self.lock:
+            for name, value in record['intervals_ms'].items():
+                self.windows[name].append(value)
+                self.totals[name][0] += 1
+                self.totals[name][1] += value
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            path = trace.attrs.get('path')
+            if path:
+                self.path_counts[path] = self.path_counts.get(path, 0) + 1
+            prometheus_text = self._prometheus_text() if self.enabled else None
+        if self.enabled:
+            self.export_queue.put((record, prometheus_text))
+        return record
+
+    def summary(self, name):
+        with self.lock:
+            values = sorted(self.windows[name])
+        return percentile(values, 0.5), percentile(values, 0.95), len(values)
+
+    def readout(self, record):
+        intervals = record['intervals_ms']
+        parts = []
+        for name, label in (('end_to_first_audio', "first audio"), ('llm_first_byte', "LLM TTFB"), ('tts_first_chunk', "TTS")):
+            if name in intervals:
+                p50, p95, _ = self.summary(name)
+                parts.append(f"{label} {intervals[name]:.0f}ms (p50 {p50:.0f}/p95 {p95:.0f})")
+        return "⏱ " + " · ".join(parts) if parts else ""
+
+    def _prometheus_text(self):
+        lines = ["# HELP diane_stage_latency_ms Per-stage turn latency in milliseconds.", "# TYPE diane_stage_latency_ms summary"]
+        for name, _, _ in STAGE_INTERVALS:
+            values = sorted(self.windows[name])
+            for quantile in (0.5, 0.95):
+                value = f"{percentile(values, quantile):.2f}" if values else "NaN"
+                lines.append(f'diane_stage_latency_ms{{stage="{name}",quantile="{quantile}"}} {value}')
+            count, total = self.totals[name]
+            lines.append(f'diane_stage_latency_ms_sum{{stage="{name}"}} {total:.2f}')
+            lines.append(f'diane_stage_latency_ms_count{{stage="{name}"}} {count}')
+        lines += ["# HELP diane_turns_total Finished turns by outcome.", "# TYPE diane_turns_total counter"]
+        lines += [f'diane_turns_total{{status="{status}"}} {count}' for status, count in sorted(self.status_counts.items())]
+        lines += ["# HELP diane_turn_path_total Finished turns by context path.", "# TYPE diane_turn_path_total counter"]
+        lines += [f'diane_turn_path_total{{path="{path}"}} {count}' for path, count in sorted(self.path_counts.items())]
+        return "\n".join(lines) + "\n"
+
+    def _export_loop(self):
+        while True:
+            record, prometheus_text = self.export_queue.get()
+            try:
+                if os.path.exists(self.jsonl_path) and os.path.getsize(self.jsonl_path) >= self.jsonl_max_bytes:
+                    os.replace(self.jsonl_path, self.jsonl_path + ".1")
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                temp_path = self.prometheus_path + ".tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(prometheus_text)
+                os.replace(temp_path, self.prometheus_path)
+            except OSError as e:
+                print(f"⚠️  Latency trace export failed: {e}")
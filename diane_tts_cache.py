@@ -0,0 +1,154 @@
+# diane_tts_cache.py
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_EXTENSION = ".tts"
+CACHE_FILE_RE = re.compile(r'[0-9a-f]{64}' + re.escape(CACHE_EXTENSION) + r'\Z')
+
+class TTSAudioCache:
+    def __init__(self, directory, max_memory_bytes=32 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_index = OrderedDict()
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(ssml_text, voice_name, pitch, encoding):
+        normalized = re.sub(r'\s+', ' ', ssml_text).strip()
+        material = "\x1f".join([normalized, str(voice_name), str(pitch), str(encoding)])
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get_from_memory(self, key):
+        with self.lock:
+            audio_bytes = self.memory.get(key)
+            if audio_bytes is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            return audio_bytes
+
+    def get(self, key):
+        audio_bytes = self.get_from_memory(key)
+        if audio_bytes is not None:
+            return audio_bytes
+        with self.lock:
+            on_disk = key in self.disk_index
+        if on_disk:
+            audio_bytes = self._read_disk(key)
+            if audio_bytes is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                    self._remember(key, audio_bytes)
+                return audio_bytes
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, audio_bytes):
+        audio_bytes = bytes(audio_bytes)
+        with self.lock:
+            self._remember(key, audio_bytes)
+            needs_write = self.directory and key not in self.disk_index
+        if needs_write:
+            self._write_disk(key, audio_bytes)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory_bytes,
+                'disk_entries': len(self.disk_index),
+                'disk_bytes': self.disk_bytes,
+            }
+
+    def _remember(self, key, audio_bytes):
+        if len(audio_bytes) > self.max_memory_bytes:
+            return
+        previous = self.memory.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self.memory[key] = audio_bytes
+        self.memory_bytes += len(audio_bytes)
+        while self.memory_bytes > self.max_memory_bytes and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _path_for(self, key):
+        return os.path.join(self.directory, f"{key}{CACHE_EXTENSION}")
+
+    def _load_disk_index(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and CACHE_FILE_RE.match(entry.name):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-len(CACHE_EXTENSION)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk_index[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+
+    def _read_disk(self, key):
+        path = self._path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                audio_bytes = f.read()
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.disk_bytes -= self.disk_index.pop(key, 0)
+            return None
+        with self.lock:
+            if key in self.disk_index:
+                self.disk_index.move_to_end(key)
+        return audio_bytes
+
+    def _write_disk(self, key, audio_bytes):
+        path = self._path_for(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(audio_bytes)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️  TTS cache write failed: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        with self.lock:
+            if key not in self.disk_index:
+                self.disk_index[key] = len(audio_bytes)
+                self.disk_bytes += len(audio_bytes)
+            self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes and self.disk_index:
+            key, size = self.disk_index.popitem(last=False)
+            self.disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path_for(key))
+            except OSError:
+                pass
@@ -0,0 +1,123 @@
+# diane_vad.py
+import sys
+import math
+from array import array
+from operator import mul
+from collections import deque
+
+DEFAULT_VAD_SETTINGS = {
+    'enabled': True,
+    'preroll_ms': 300,
+    'speech_start_ms': 60,
+    'hangover_ms': 300,
+    'endpoint_silence_ms': 900,
+    'no_speech_timeout_ms': 8000,
+    'silence_keepalive_ms': 1000,
+    'speech_margin_db': 12.0,
+    'min_speech_dbfs': -50.0,
+    'initial_noise_dbfs': -60.0,
+    'noise_adapt_rate': 0.05,
+}
+SILENCE_DBFS = -120.0
+
+def chunk_level_dbfs(data):
+    samples = array('h', data)
+    if not samples:
+        return SILENCE_DBFS
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    energy = sum(map(mul, samples, samples)) / len(samples)
+    if energy <= 0:
+        return SILENCE_DBFS
+    return max(SILENCE_DBFS, 20 * math.log10(math.sqrt(energy) / 32768))
+
+class VoiceActivityDetector:
+    def __init__(self, settings, rate, chunk_frames, sample_width=2):
+        self.settings = dict(DEFAULT_VAD_SETTINGS, **(settings or {}))
+        self.enabled = self.settings['enabled'] and sample_width == 2
+        if self.settings['enabled'] and not self.enabled:
+            print(f"⚠️  VAD needs 16-bit samples (got {sample_width * 8}-bit). Streaming all audio unfiltered.")
+        self.chunk_ms = chunk_frames / rate * 1000
+        self.preroll = deque(maxlen=max(1, self._chunks('preroll_ms')))
+        self.speech_start_chunks = max(1, self._chunks('speech_start_ms'))
+        self.hangover_chunks = self._chunks('hangover_ms')
+        self.endpoint_chunks = self._chunks('endpoint_silence_ms')
+        self.no_speech_chunks = self._chunks('no_speech_timeout_ms')
+        self.keepalive_chunks = self._chunks('silence_keepalive_ms')
+        self.noise_floor = self.settings['initial_noise_dbfs']
+        self.in_speech = False
+        self.heard_speech = False
+        self.voiced_run = 0
+        self.silence_run = 0
+        self.unsent_run = 0
+        self.endpoint = None
+        self.counts = {'chunks': 0, 'sent': 0, 'speech': 0, 'preroll_sent': 0, 'keepalive_sent': 0, 'bytes_sent': 0, 'bytes_suppressed': 0}
+        self.first_speech_ms = None
+
+    def _chunks(self, key):
+        milliseconds = self.settings[key]
+        return int(math.ceil(milliseconds / self.chunk_ms)) if milliseconds else 0
+
+    def process(self, data):
+        self.counts['chunks'] += 1
+        if not self.enabled:
+            return self._send([data])
+        level = chunk_level_dbfs(data)
+        voiced = level >= max(self.settings['min_speech_dbfs'], self.noise_floor + self.settings['speech_margin_db'])
+        if voiced:
+            self.counts['speech'] += 1
+        else:
+            self.noise_floor += self.settings['noise_adapt_rate'] * (level - self.noise_floor)
+
+        if self.in_speech:
+            self.silence_run = 0 if voiced else self.silence_run + 1
+            if self.silence_run > self.hangover_chunks:
+                self.in_speech, self.voiced_run = False, 0
+            outgoing = self._send([data])
+        else:
+            self.voiced_run = self.voiced_run + 1 if voiced else 0
+            if not voiced and self.heard_speech:
+                self.silence_run += 1
+            if self.voiced_run >= self.speech_start_chunks:
+                outgoing = self._start_speech(data)
+            else:
+                outgoing = self._hold_silence(data)
+
+        if self.heard_speech and self.endpoint_chunks and self.silence_run >= self.endpoint_chunks:
+            self.endpoint = 'trailing_silence'
+        elif not self.heard_speech and self.no_speech_chunks and self.counts['chunks'] >= self.no_speech_chunks:
+            self.endpoint = 'no_speech'
+        return outgoing
+
+    def _start_speech(self, data):
+        self.in_speech = True
+        self.silence_run = 0
+        if not self.heard_speech:
+            self.heard_speech = True
+            self.first_speech_ms = round(self.counts['chunks'] * self.chunk_ms)
+        preroll = list(self.preroll)
+        self.preroll.clear()
+        self.counts['preroll_sent'] += len(preroll)
+        return self._send(preroll + [data])
+
+    def _hold_silence(self, data):
+        self.unsent_run += 1
+        if self.keepalive_chunks and self.unsent_run >= self.keepalive_chunks:
+            self.preroll.clear()
+            self.counts['keepalive_sent'] += 1
+            return self._send([data])
+        if len(self.preroll) == self.preroll.maxlen:
+            self.counts['bytes_suppressed'] += len(self.preroll[0])
+        self.preroll.append(data)
+        return []
+
+    def _send(self, chunks):
+        self.unsent_run = 0
+        self.counts['sent'] += len(chunks)
+        self.counts['bytes_sent'] += sum(len(chunk) for chunk in chunks)
+        return chunks
+
+    def stats(self):
+        suppressed = self.counts['bytes_suppressed'] + sum(len(chunk) for chunk in self.preroll)
+        total = self.counts['bytes_sent'] + suppressed
+        return dict(self.counts, bytes_suppressed=suppressed, suppressed_ratio=round(suppressed / total, 3) if total else 0.0, endpoint=self.endpoint, first_speech_ms=self.first_speech_ms, noise_floor_dbfs=round(self.noise_floor, 1), enabled=self.enabled)